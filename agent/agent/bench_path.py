@@ -0,0 +1,75 @@
+from gym_cooking.envs.overcooked_environment import OvercookedEnvironment, MapSetting
+from agent.executor.low import EnvState
+from agent.executor import path
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+ACTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0), (0, 0)]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Low-level path search benchmark")
+    parser.add_argument(
+        "--levels", type=str, nargs='+',
+        default=['new1', 'new2', 'new3', 'new4', 'new5']
+    )
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+
+    return parser.parse_args()
+
+
+def collect_states(level, ticks, seed):
+    # states seen by agent 0 while both agents move at random, the ai thread runs at a few fps
+    # so agents are often still between two states
+    random.seed(seed)
+    np.random.seed(seed)
+    rng = random.Random(seed)
+    env = OvercookedEnvironment(MapSetting(level=level, max_num_timesteps=10 ** 6), headless=True)
+    env.reset()
+    names = [agent.name for agent in env.sim_agents]
+
+    states = []
+    for _ in range(ticks):
+        env.step({name: rng.choice(ACTIONS) if rng.random() < 0.3 else (0, 0) for name in names})
+        info = env.get_ai_snapshot()
+        states.append(EnvState(world=info['world'],
+                               agents=info['sim_agents'],
+                               agent_idx=0,
+                               order=info['order_scheduler'],
+                               event_history=info['event_history'],
+                               time=info['current_time'],
+                               chg_grid=info['chg_grid']))
+    return states
+
+
+def bench(states, cached):
+    # the two searches of LTApproach towards every gridsquare but floors
+    targets = [pos for pos, gs in states[0].pos_gs.items() if gs.name != 'Floor']
+    path._search_cache.clear()
+    start = time.time()
+    for e in states:
+        for pos in targets:
+            if cached:
+                path.bfs_search_cached(e.to_grid_a_key, e.to_grid_a, e.self_pos, [pos])
+                path.bfs_search_cached(e.to_grid_key, e.to_grid, e.self_pos, [pos])
+            else:
+                path.bfs_search(e.to_grid_a, e.self_pos, [pos])
+                path.bfs_search(e.to_grid, e.self_pos, [pos])
+    return (time.time() - start) / (len(states) * len(targets) * 2) * 1e6
+
+
+if __name__ == '__main__':
+    arglist = parse_arguments()
+
+    print(f"{'level':<8}{'search':>12}{'cached':>12}{'speedup':>10}")
+    for level in arglist.levels:
+        states = collect_states(level, arglist.ticks, arglist.seed)
+        search = bench(states, False)
+        cached = bench(states, True)
+        print(f"{level:<8}{search:>12.1f}{cached:>12.1f}{search / cached:>9.1f}x")
+    print("(us/search)")
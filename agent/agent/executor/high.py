@@ -151,6 +151,11 @@ class HighTask:
 
         return self.Success, (0, 0), "Completed"
 
+    @property
+    def near_done(self):
+        # running the last mid task, so the next call to finish it ends the high task
+        return self._last_task and len(self._task) == 1
+
     def __str__(self):
         return 'HighTask'
 
@@ -2,112 +2,17 @@ from collections import namedtuple, defaultdict
 from copy import copy, deepcopy
 import random
 
-from gym_cooking.utils.core import GridSquare, Object, mergeable, \
+from gym_cooking.utils.core import GridSquare, Object, GridSquareSnapshot, ObjectSnapshot, mergeable, \
     GRIDSQUARES, PUTTABLE_GRIDSQUARES, FOOD_TILE, \
     FRESH_FOOD, CHOPPING_FOOD, CHOPPED_FOOD, COOKING_FOOD, COOKED_FOOD, CHARRED_FOOD, \
     ASSEMBLE_CHOPPED_FOOD, ASSEMBLE_CHOPPED_PLATE_FOOD, ASSEMBLE_COOKING_FOOD, ASSEMBLE_COOKING_PLATE_FOOD, \
     ASSEMBLE_COOKED_FOOD, ASSEMBLE_COOKED_PLATE_FOOD, ASSEMBLE_CHARRED_FOOD, ASSEMBLE_CHARRED_PLATE_FOOD
-from gym_cooking.utils.world import World
-from gym_cooking.utils.agent import SimAgent
-from gym_cooking.utils.order_schedule import OrderScheduler
+from gym_cooking.utils.world import World, WorldSnapshot
+from gym_cooking.utils.agent import SimAgent, AgentSnapshot
+from gym_cooking.utils.order_schedule import OrderScheduler, OrderSchedulerSnapshot
 from gym_cooking.utils.event import Event
-
-
-def bfs_search(grid: list[list[int]], start: tuple[int, int], end: list[tuple[int, int]]):
-    # used for calculating path for agent
-    # input: grid: True for available, False for unavailable
-    #        start: start position
-    #        end: end position(s)
-    # output: distance, -1 if not found
-    #         move: move sequence, from next_pos to end_pos
-
-    point = namedtuple('point', ['x', 'y', 'parent'])
-    queue = [point(start[0], start[1], None)]
-    visited = set()
-    visited.add(start)
-    curr = point(start[0], start[1], None)
-    while queue:
-        curr = queue.pop(0)
-        if (curr.x, curr.y) in end:  # wrong when heading multiple end point
-            break
-        for x_inc, y_inc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:  # wrong when heading multiple end point
-            x = curr.x + x_inc
-            y = curr.y + y_inc
-            if ((x, y) in end or grid[x][y]) and (x, y) not in visited:
-                queue.append(point(x, y, curr))
-                visited.add((x, y))
-    # prepare result
-    if (curr.x, curr.y) not in end:
-        return -1, None
-    move = []
-    while curr.parent:
-        move.append((curr.x, curr.y))
-        curr = curr.parent
-    move.reverse()
-    return len(move), move
-
-def bfs_search_all(grid: list[list[int]], start: tuple[int, int]):
-    # used for calculating path for agent
-    # input: grid: True for available, False for unavailable
-    #        start: start position
-    #        end: end position(s)
-    # output: distance, -1 if not found
-    #         move: move sequence, from next_pos to end_pos
-    result = [[[None, -1] for _ in range(len(grid[0]))] for _ in range(len(grid))]
-    visited = [[False for _ in range(len(grid[0]))] for _ in range(len(grid))]
-
-    point = namedtuple('point', ['x', 'y', 'move', 'dist'])
-    queue = []
-
-    result[start[0]][start[1]] = [None, -1]
-    visited[start[0]][start[1]] = True
-
-    for x_inc, y_inc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:  # wrong when heading multiple end point
-        x = start[0] + x_inc
-        y = start[1] + y_inc
-        result[x][y] = [(x, y), 1]
-        visited[x][y] = True
-
-        if grid[x][y]:
-            queue.append(point(x, y, (x_inc, y_inc), 1))
-
-    while queue:
-        curr = queue.pop(0)
-        for x_inc, y_inc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:  # wrong when heading multiple end point
-            x = curr.x + x_inc
-            y = curr.y + y_inc
-            result[x][y] = [(x, y), curr.dist]
-            if grid[x][y] and not visited[x][y]:
-                visited[x][y] = True
-                queue.append(point(x, y, curr.move, curr.dist + 1))
-
-    return result
-
-
-def bfs_reachable(grid: list[list[int]], start: tuple[int, int]) -> list[list[bool]]:
-    # used for calculating path for agent
-    # input: grid: True for available, False for unavailable
-    #        start: start position
-    #        end: end position(s)
-    # output: distance, -1 if not found
-    #         move: move sequence, from next_pos to end_pos
-    reach_map = [[False for _ in range(len(grid[0]))] for _ in range(len(grid))]
-    point = namedtuple('point', ['x', 'y'])
-    queue = [point(start[0], start[1])]
-    visited = set()
-    visited.add(start)
-    reach_map[start[0]][start[1]] = True
-    while queue:
-        curr = queue.pop(0)
-        for x_inc, y_inc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:  # wrong when heading multiple end point
-            x = curr.x + x_inc
-            y = curr.y + y_inc
-            reach_map[x][y] = True
-            if grid[x][y] and (x, y) not in visited:
-                queue.append(point(x, y))
-                visited.add((x, y))
-    # prepare result
-    return reach_map
+from agent.executor.path import bfs_search, bfs_search_all, bfs_reachable, bfs_search_cached, \
+    bfs_distance, near_distance, get_layout
 
 
 def match_any(inner: list[str] | str | None, outer: list[str] | str | None) -> bool:
@@ -145,10 +50,11 @@ def fname_content(obj: Object | None) -> list[str]:
 
 class EnvState:
     # a class to store the environment state
-    def __init__(self, world: World,
-                 agents: list[SimAgent],
+    # world, agents and order are either the live ones or their snapshots (see get_ai_snapshot)
+    def __init__(self, world: World | WorldSnapshot,
+                 agents: list[SimAgent | AgentSnapshot],
                  agent_idx: int,
-                 order: OrderScheduler,
+                 order: OrderScheduler | OrderSchedulerSnapshot,
                  event_history: list[Event],
                  chg_grid,
                  time: float):
@@ -165,34 +71,53 @@ class EnvState:
         self.pos_obj = defaultdict(lambda: None)
         self.pos_gs = defaultdict(lambda: None)
         for o in self.world_all:
-            if isinstance(o, GridSquare):
+            if isinstance(o, (GridSquare, GridSquareSnapshot)):
                 self.pos_gs[o.location] = o
             else:
                 self.pos_obj[o.location] = o
+        for pos in self.pos_gs:
+            self.pos_obj.setdefault(pos, None)
+
+        # name to pos, for get_pos_by_obj_gs
+        self.all_pos = list(set(self.pos_obj.keys()) | set(self.pos_gs.keys()))
+        self.pos_order = {pos: i for i, pos in enumerate(self.all_pos)}
+        self.pos_by_fname = defaultdict(set)
+        self.pos_by_content = defaultdict(set)
+        self.pos_by_gs = defaultdict(set)
+        for pos in self.all_pos:
+            self.pos_by_fname[fname(self.pos_obj[pos])].add(pos)
+            for name in fname_content(self.pos_obj[pos]):
+                self.pos_by_content[name].add(pos)
+            self.pos_by_gs["Nothing" if self.pos_gs[pos] is None else self.pos_gs[pos].name].add(pos)
 
         # all objs
-        self.all_obj = [a for a in self.world_all if isinstance(a, Object) and not a.is_held]
+        self.all_obj = [a for a in self.world_all if isinstance(a, (Object, ObjectSnapshot)) and not a.is_held]
         self.all_obj_h = self.all_obj + ([self.hold] if self.hold is not None else [])
         self.all_obj_a = self.all_obj + [a.holding for a in self.agents if a.holding is not None]
 
-        # to grid
-        self.to_grid = [[1 for _ in range(self.world_height)] for _ in range(self.world_width)]
-        for obj in self.world_all:
-            if obj.collidable: self.to_grid[obj.location[0]][obj.location[1]] = 0
-        self.to_grid_a = deepcopy(self.to_grid)
+        # to grid, the layout is shared by all states of the same map
+        self.layout = get_layout(self.world_width, self.world_height,
+                                 frozenset(obj.location for obj in self.world_all if obj.collidable))
+        self.to_grid = self.layout.grid
+        self.to_grid_a = [row[:] for row in self.to_grid]
+        walkable_a = self.layout.walkable.copy()
         for agent in self.agents[:self.agent_idx] + self.agents[self.agent_idx + 1:]:
             self.to_grid_a[agent.location[0]][agent.location[1]] = 0
+            walkable_a[agent.location] = False
+        # keys of the blocked cells of to_grid and to_grid_a, for bfs_search_cached
+        self.to_grid_key = self.layout
+        self.to_grid_a_key = (self.layout, tuple(agent.location for agent in
+                                                 self.agents[:self.agent_idx] + self.agents[self.agent_idx + 1:]))
 
         # reachable map
-        self.rch_map = bfs_reachable(self.to_grid, self.self_pos)
+        self.near_dist, self.rch_map = self.layout.fields(self.self_pos)
         self.rch_obj = [o for o in self.all_obj if self.rch_map[o.location[0]][o.location[1]]]
         self.rch_obj_h = self.rch_obj + ([self.hold] if self.hold is not None else [])
-        self.rch_grid = [a for a in self.world_all if isinstance(a, GridSquare)
+        self.rch_grid = [a for a in self.world_all if isinstance(a, (GridSquare, GridSquareSnapshot))
                          and self.rch_map[a.location[0]][a.location[1]]]
 
-        # bfs search
-        self.bfs_search_a = bfs_search_all(self.to_grid_a, self.self_pos)
-        self.bfs_search = bfs_search_all(self.to_grid, self.self_pos)
+        # distance fields, only the one blocked by other agents changes every tick
+        self.near_dist_a = near_distance(walkable_a, bfs_distance(walkable_a, self.self_pos), self.self_pos)
 
     @property
     def self_pos(self):
@@ -218,15 +143,16 @@ class EnvState:
         if isinstance(obj, str): obj = [obj]
         if isinstance(gs, str): gs = [gs]
         # 2 match
+        if obj is None:
+            matched = set(self.all_pos)
+        else:
+            index = self.pos_by_content if inner else self.pos_by_fname
+            matched = set().union(*[index.get(name, ()) for name in obj])
+        if gs is not None:
+            matched &= set().union(*[self.pos_by_gs.get(name, ()) for name in gs])
+        # same order as scanning all positions
         results = set()
-        for pos in set(self.pos_obj.keys()) | set(self.pos_gs.keys()):
-            if inner:
-                obj_fname = fname_content(self.pos_obj[pos])
-            else:
-                obj_fname = fname(self.pos_obj[pos])
-            if not match_any(obj_fname, obj): continue
-            gs_name = "Nothing" if self.pos_gs[pos] is None else self.pos_gs[pos].name
-            if not match_any(gs_name, gs): continue
+        for pos in sorted(matched, key=self.pos_order.get):
             results.add(pos)
         return list(results)
 
@@ -257,21 +183,20 @@ class EnvState:
         pos_list = self.get_pos_by_obj_gs(obj, gs, inner)
         if not pos_list: return None
         # 2 get closeest object regarding other agents
-        moves = [self.bfs_search_a[pos[0]][pos[1]] for pos in pos_list]
-        moves = [m for m in moves if m[1] > 0]
-        moves.sort(key=lambda x:x[1])
-        if len(moves) > 0:
-            return moves[0][0]
-        if agent:
-            return None
+        pos = self._closest(self.near_dist_a, pos_list)
+        if pos is not None or agent:
+            return pos
         # 3 get closest object regardless other objects
-        moves = [self.bfs_search[pos[0]][pos[1]] for pos in pos_list]
-        moves = [m for m in moves if m[1] > 0]
-        moves.sort(key=lambda x: x[1])
-        if len(moves) > 0:
-            return moves[0][0]
-        else:
+        return self._closest(self.near_dist, pos_list)
+
+    @staticmethod
+    def _closest(near_dist, pos_list: list) -> tuple[int, int] | None:
+        # first position with the smallest positive distance
+        dists = [near_dist[pos] for pos in pos_list]
+        dists = [(d, i) for i, d in enumerate(dists) if d > 0]
+        if not dists:
             return None
+        return pos_list[min(dists)[1]]
 
     def get_all_grid_info(self) -> list:
         res: list = []
@@ -304,16 +229,14 @@ class LTApproach(LowTask):
 
     def __call__(self, env: EnvState):
         # 1 consider other agents
-        grid = env.to_grid_a
-        distance, move = bfs_search(grid, env.self_pos, [self.pos])
+        distance, move = bfs_search_cached(env.to_grid_a_key, env.to_grid_a, env.self_pos, [self.pos])
         if distance > 1:
             m = (move[0][0] - env.self_pos[0], move[0][1] - env.self_pos[1])
             return LTApproach.Working, m
         elif distance == 1:
             return LTApproach.Success, (0, 0)
         # 2 blocked by agent
-        grid = env.to_grid
-        distance, move = bfs_search(grid, env.self_pos, [self.pos])
+        distance, move = bfs_search_cached(env.to_grid_key, env.to_grid, env.self_pos, [self.pos])
         other_agent_pos = [agent.location for agent in env.agents[:env.agent_idx] + env.agents[env.agent_idx + 1:]]
         if distance < 0:
             return LTApproach.DestUnreachable, (0, 0)
@@ -0,0 +1,222 @@
+import threading
+from collections import deque, OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+# search order of the moves, paths depend on it
+MOVES = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+
+@lru_cache(maxsize=None)
+def _neighbor_table(width: int, height: int) -> tuple:
+    # cells are flat indices x * height + y
+    # output: (x, y) of every cell, in-bounds neighbors of every cell in MOVES order
+    cells = tuple((x, y) for x in range(width) for y in range(height))
+    neighbors = tuple(tuple((x + dx) * height + y + dy for dx, dy in MOVES
+                            if 0 <= x + dx < width and 0 <= y + dy < height)
+                      for x, y in cells)
+    return cells, neighbors
+
+
+def _flatten(grid: list[list[int]]) -> list:
+    return [v for col in grid for v in col]
+
+
+def bfs_search(grid: list[list[int]], start: tuple[int, int], end: list[tuple[int, int]]):
+    # used for calculating path for agent
+    # input: grid: True for available, False for unavailable
+    #        start: start position
+    #        end: end position(s)
+    # output: distance, -1 if not found
+    #         move: move sequence, from next_pos to end_pos
+    width, height = len(grid), len(grid[0])
+    cells, neighbors = _neighbor_table(width, height)
+    available = _flatten(grid)
+    goals = {x * height + y for x, y in end}
+
+    curr = start[0] * height + start[1]
+    parent = {curr: None}
+    queue = deque([curr])
+    while queue:
+        curr = queue.popleft()
+        if curr in goals:  # wrong when heading multiple end point
+            break
+        for i in neighbors[curr]:
+            if (i in goals or available[i]) and i not in parent:
+                parent[i] = curr
+                queue.append(i)
+    # prepare result
+    if curr not in goals:
+        return -1, None
+    move = []
+    while parent[curr] is not None:
+        move.append(cells[curr])
+        curr = parent[curr]
+    move.reverse()
+    return len(move), move
+
+
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+SEARCH_CACHE_SIZE = 4096
+
+
+def bfs_search_cached(grid_key, grid: list[list[int]], start: tuple[int, int], end: list[tuple[int, int]]):
+    # same as bfs_search, memoized on (grid_key, start, end)
+    # grid_key: hashable, identifies the blocked cells of grid (see EnvState.to_grid_key)
+    key = (grid_key, start, tuple(end))
+    with _search_cache_lock:
+        result = _search_cache.get(key)
+        if result is not None:
+            _search_cache.move_to_end(key)
+    if result is None:
+        distance, move = bfs_search(grid, start, end)
+        result = (distance, None if move is None else tuple(move))
+        with _search_cache_lock:
+            _search_cache[key] = result
+            if len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
+    distance, move = result
+    return distance, None if move is None else list(move)
+
+
+def bfs_search_all(grid: list[list[int]], start: tuple[int, int]):
+    # used for calculating path for agent
+    # input: grid: True for available, False for unavailable
+    #        start: start position
+    # output: [pos, distance] for every position, see near_distance
+    width, height = len(grid), len(grid[0])
+    cells, neighbors = _neighbor_table(width, height)
+    available = _flatten(grid)
+    result = [[None, -1] for _ in cells]
+    visited = [False] * len(cells)
+
+    curr = start[0] * height + start[1]
+    visited[curr] = True
+    queue = deque()
+    for i in neighbors[curr]:
+        result[i] = [cells[i], 1]
+        visited[i] = True
+        if available[i]:
+            queue.append((i, 1))
+
+    while queue:
+        curr, dist = queue.popleft()
+        for i in neighbors[curr]:
+            result[i] = [cells[i], dist]
+            if available[i] and not visited[i]:
+                visited[i] = True
+                queue.append((i, dist + 1))
+
+    return [result[x * height:(x + 1) * height] for x in range(width)]
+
+
+def bfs_reachable(grid: list[list[int]], start: tuple[int, int]) -> list[list[bool]]:
+    # used for calculating path for agent
+    # input: grid: True for available, False for unavailable
+    #        start: start position
+    # output: positions reached from start and their neighbors
+    width, height = len(grid), len(grid[0])
+    cells, neighbors = _neighbor_table(width, height)
+    available = _flatten(grid)
+    reach = [False] * len(cells)
+
+    curr = start[0] * height + start[1]
+    reach[curr] = True
+    visited = {curr}
+    queue = deque([curr])
+    while queue:
+        curr = queue.popleft()
+        for i in neighbors[curr]:
+            reach[i] = True
+            if available[i] and i not in visited:
+                queue.append(i)
+                visited.add(i)
+    # prepare result
+    return [reach[x * height:(x + 1) * height] for x in range(width)]
+
+
+def bfs_distance(walkable: np.ndarray, start: tuple[int, int]) -> np.ndarray:
+    # steps from start to every cell over walkable cells (start is always passable)
+    # output: int array, -1 for unreachable
+    dist = np.full(walkable.shape, -1, dtype=np.int32)
+    passable = walkable.copy()
+    passable[start] = True
+    frontier = np.zeros(walkable.shape, dtype=bool)
+    frontier[start] = True
+    dist[start] = 0
+    d = 0
+    while frontier.any():
+        d += 1
+        new = np.zeros(walkable.shape, dtype=bool)
+        new[1:, :] |= frontier[:-1, :]
+        new[:-1, :] |= frontier[1:, :]
+        new[:, 1:] |= frontier[:, :-1]
+        new[:, :-1] |= frontier[:, 1:]
+        new &= passable & (dist < 0)
+        dist[new] = d
+        frontier = new
+    return dist
+
+
+def _neighbors(a: np.ndarray, fill) -> list[np.ndarray]:
+    # the four neighbors of every cell, fill outside the map
+    p = np.pad(a, 1, constant_values=fill)
+    return [p[2:, 1:-1], p[:-2, 1:-1], p[1:-1, 2:], p[1:-1, :-2]]
+
+
+def near_distance(walkable: np.ndarray, dist: np.ndarray, start: tuple[int, int]) -> np.ndarray:
+    # distance field used by EnvState.navigate_pos_by_obj_gs, same values as bfs_search_all:
+    # for every cell, the largest distance among its reachable walkable neighbors (start excluded),
+    # 1 for the neighbors of start that have none, -1 elsewhere
+    queued = np.where(walkable & (dist > 0), dist, -1)
+    near = np.maximum.reduce(_neighbors(queued, -1))
+    x, y = start
+    for nx, ny in [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]:
+        if 0 <= nx < near.shape[0] and 0 <= ny < near.shape[1] and near[nx, ny] < 1:
+            near[nx, ny] = 1
+    return near
+
+
+def reachable(dist: np.ndarray) -> np.ndarray:
+    # cells reached from start and their neighbors, same values as bfs_reachable
+    reached = dist >= 0
+    return np.logical_or.reduce([reached] + _neighbors(reached, False))
+
+
+class GridLayout:
+    # static part of a map: which cells are blocked by gridsquares
+    # distance fields without agents only depend on the layout, so they are computed once per start
+    def __init__(self, width: int, height: int, blocked: frozenset):
+        self.walkable = np.ones((width, height), dtype=bool)
+        for x, y in blocked:
+            self.walkable[x, y] = False
+        self.grid = self.walkable.astype(int).tolist()   # shared, do not modify
+
+        self._fields = {}
+        self._lock = threading.Lock()
+
+    def fields(self, start: tuple[int, int]) -> tuple[np.ndarray, list[list[bool]]]:
+        # output: near_distance and reachable map (nested lists) from start
+        with self._lock:
+            fields = self._fields.get(start)
+        if fields is None:
+            dist = bfs_distance(self.walkable, start)
+            fields = (near_distance(self.walkable, dist, start), reachable(dist).tolist())
+            with self._lock:
+                self._fields[start] = fields
+        return fields
+
+
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def get_layout(width: int, height: int, blocked: frozenset) -> GridLayout:
+    key = (width, height, blocked)
+    with _layouts_lock:
+        layout = _layouts.get(key)
+        if layout is None:
+            layout = _layouts[key] = GridLayout(width, height, blocked)
+    return layout
@@ -2,7 +2,7 @@
 from gym_cooking.misc.game.game import Game
 from gym_cooking.misc.game.utils import *
 from gym_cooking.utils.gui import popup_text
-from gym_cooking.utils.replay import Replay
+from gym_cooking.utils.replay import Replay, CHECKPOINT_STEPS
 from agent.executor.low import EnvState
 from agent.mind.agent import get_agent, AgentSetting
 
@@ -12,8 +12,6 @@ import threading
 import queue
 import time
 
-from copy import deepcopy as dcopy
-
 # import vosk
 # from vosk import Model, KaldiRecognizer
 # import pyaudio
@@ -84,8 +82,9 @@ class GamePlay(Game):
         last_t = time.time()
         action_dict = {agent.name: None for agent in self.sim_agents}
 
+        self.replay.checkpoint(self.env.get_checkpoint())
         self.on_render(paused=paused)
-        info = self.env.get_ai_info()
+        info = self.env.get_ai_snapshot()
         e = EnvState(world=info['world'],
                      agents=info['sim_agents'],
                      agent_idx=1 - idx_human,
@@ -121,12 +120,14 @@ class GamePlay(Game):
                 self.replay.log(
                     'env.step', {'action_dict': ad, 'passed_time': seconds_per_step})
                 _, _, done, _ = self.env.step(ad, passed_time=seconds_per_step)
+                if self.env.t % CHECKPOINT_STEPS == 0:
+                    self.replay.checkpoint(self.env.get_checkpoint())
                 if done:
                     self._success = True
                     self._q_control.put(('Quit', {}))
                     return
 
-                info = self.env.get_ai_info()
+                info = self.env.get_ai_snapshot()
                 e = EnvState(world=info['world'],
                              agents=info['sim_agents'],
                              agent_idx=0,
@@ -135,7 +136,7 @@ class GamePlay(Game):
                              time=info['current_time'],
                              chg_grid=info['chg_grid'])
                 if action_dict[self.sim_agents[0].name] is not None:
-                    self._q_ai.put(('Env', {"EnvState": dcopy(e)}))
+                    self._q_ai.put(('Env', {"EnvState": e}))
                 action_dict = {agent.name: None for agent in self.sim_agents}
 
             sleep_time = max(seconds_per_step - (time.time() - last_t), 0)
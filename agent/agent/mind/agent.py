@@ -5,11 +5,12 @@ import time
 from copy import copy, deepcopy
 import random
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 from agent.executor.low import EnvState
 from agent.executor.high import HighTask
 from agent.mind.prompt_local import MOVE_TO_HT, prep_prompt, prep_prompt_s
-from agent.mind.call import low, high, mix_L
+from agent.mind.call import low, high, mix_L, Em_prompt_key
 from gym_cooking.utils.replay import Replay
 
 
@@ -30,6 +31,7 @@ class AgentSetting:
     high_llm: str = 'gpt-3.5'
     low_llm: str = 'llama'
     speed: float = 2.5
+    prefetch: bool = True
 
 
 class HLAagent:
@@ -53,6 +55,9 @@ class HLAagent:
         self._num_high_threads = 0
         # low level
         self._mov_hist: list = []  # task, status, submit_time, finish_time
+        # low level request in flight: future, prep, key, prefetch, time_start
+        self._low = None
+        self._low_pool = ThreadPoolExecutor(max_workers=2)
 
         # thread safe
         self._it_time = 0
@@ -91,14 +96,15 @@ class HLAagent:
 
         return mov_his
 
-    def _get_low_mov_hist(self):
+    def _get_low_mov_hist(self, mov_hist: list = None):
+        mov_hist = self._mov_hist if mov_hist is None else mov_hist
         if self._is_finished:
-            mov_his = self._mov_hist[-100:]
+            mov_his = mov_hist[-100:]
             mov_his = [m for m in mov_his if m['status'].startswith('Success')]
             mov_his = mov_his[-self.MAX_MOV_FIX_MOV:]
         else:
             intent_time = self._int_hist[-1]['submit_time']
-            mov_his = self._mov_hist[-100:]
+            mov_his = mov_hist[-100:]
             mov_his = [m for m in mov_his if m['finish_time'] > intent_time]
             mov_his = [m for m in mov_his if m['status'].startswith('Success')]
             mov_his = mov_his[-self.MAX_MOV_UNG_MOV:]
@@ -236,24 +242,60 @@ class HLAagent:
         thread.start()
 
     def low_level_infer(self):
-        submit_time = time.time()
-
+        # non-blocking: the move is scored on the worker pool, self._task is set once it lands
         llm_his = self._get_mov_infer_prep()
         mov_his = self._get_low_mov_hist()
 
         prep = prep_prompt(self._last_env, [], llm_his, mov_his, '')
+        # a prefetched move is only used when the prompt it was scored on matches the
+        # real one, otherwise the world has changed and it is dropped
+        if self._low is None or self._low['prefetch'] and self._low['key'] != Em_prompt_key(prep):
+            self._submit_low_level(deepcopy(prep), prefetch=False)
+        if not self._low['future'].done():
+            return
+
+        low, self._low = self._low, None
         try:
-            ht = request_client("Em", self.setting.low_llm, prep)
+            ht, time_end = low['future'].result()
         except:
             return
-        finish_time = time.time()
-
-        self.replay.log("ai.mov_infer",
-                        {"prep": prep, "ret": ht, "time_start": submit_time, "time_end": finish_time})
+        if low['prefetch']:
+            submit_time = finish_time = time.time()
+            self.replay.log("ai.mov_infer",
+                            {"prep": low['prep'], "ret": ht, "time_start": low['time_start'], "time_end": time_end,
+                             "prefetch": True})
+        else:
+            submit_time, finish_time = low['time_start'], time_end
+            self.replay.log("ai.mov_infer",
+                            {"prep": low['prep'], "ret": ht, "time_start": submit_time, "time_end": finish_time})
         self._task = deepcopy(MOVE_TO_HT[ht])
         self._mov_hist.append({'task': str(self._task), 'status': 'Ongoing. Initiated.',
                                'submit_time': submit_time, 'finish_time': finish_time})
 
+    def _low_level_request(self, prep: dict):
+        ht = request_client("Em", self.setting.low_llm, prep)
+        return ht, time.time()
+
+    def _submit_low_level(self, prep: dict, prefetch: bool):
+        self._low = {'future': self._low_pool.submit(self._low_level_request, prep),
+                     'prep': prep, 'key': Em_prompt_key(prep), 'prefetch': prefetch, 'time_start': time.time()}
+
+    def _prefetch_low_level(self):
+        # score the next move in the background, assuming the current task succeeds
+        # and the world stays as it is now
+        if self._low is not None and not self._low['future'].done():
+            return
+
+        mov_hist = self._mov_hist[:-1] + [dict(self._mov_hist[-1], status='Success.')]
+        llm_his = self._get_mov_infer_prep()
+        mov_his = self._get_low_mov_hist(mov_hist)
+
+        prep = deepcopy(prep_prompt(self._last_env, [], llm_his, mov_his, ''))
+        if self._low is not None and self._low['key'] == Em_prompt_key(prep):
+            return
+
+        self._submit_low_level(prep, prefetch=True)
+
     def _check_interrupt(self):
         # check llm incoming
         if self._llm_hist and self._lt_time < self._llm_hist[-1]['finish_time']:
@@ -270,6 +312,7 @@ class HLAagent:
                 if self._mov_hist and self._mov_hist[-1]['status'].startswith('Ongoing'):
                     self._mov_hist[-1]['status'] = 'Interrupted. '
                 self._task = None
+                self._low = None
         if self._int_hist and self._int_hist[-1]['finish_time'] is not None \
                 and self._it_time < self._int_hist[-1]['finish_time']:
             self._it_time = self._int_hist[-1]['finish_time']
@@ -277,6 +320,7 @@ class HLAagent:
                 if self._mov_hist and self._mov_hist[-1]['status'].startswith('Ongoing'):
                     self._mov_hist[-1]['status'] = 'Interrupted. '
                 self._task = None
+                self._low = None
 
         return chat
 
@@ -309,12 +353,15 @@ class HLAagent:
         while True:
             if self._task is None:
                 self.low_level_infer()
-            if self._task is None:
-                continue
+            if self._task is None:  # move not scored yet, keep still
+                self._lock.release()
+                return (0, 0), chat
 
             state, move, msg = self._task(env)
             if state == HighTask.Working:  # working
                 self._mov_hist[-1]['status'] = 'Ongoing. ' + msg
+                if self.setting.prefetch and self._task.near_done:
+                    self._prefetch_low_level()
                 self._lock.release()
                 return move, chat
             elif state == HighTask.Failed:  # reassign task
@@ -754,6 +801,9 @@ class NEAagent:
         self._num_high_threads = 0
         # low level
         self._mov_hist: list = []  # task, status, submit_time, finish_time
+        # low level request in flight: future, prep, time_start
+        self._low = None
+        self._low_pool = ThreadPoolExecutor(max_workers=2)
 
         # thread safe
         self._it_time = 0
@@ -937,17 +987,23 @@ class NEAagent:
         thread.start()
 
     def low_level_infer(self):
-        submit_time = time.time()
-
-        llm_his = self._get_mov_infer_prep()
-        mov_his = self._get_low_mov_hist()
+        # non-blocking: the move is scored on the worker pool, self._task is set once it lands
+        if self._low is None:
+            llm_his = self._get_mov_infer_prep()
+            mov_his = self._get_low_mov_hist()
+
+            prep = deepcopy(prep_prompt_s(self._last_env, [], llm_his, mov_his, ''))
+            self._low = {'future': self._low_pool.submit(self._low_level_request, prep),
+                         'prep': prep, 'time_start': time.time()}
+        if not self._low['future'].done():
+            return
 
-        prep = prep_prompt_s(self._last_env, [], llm_his, mov_his, '')
+        low, self._low = self._low, None
+        prep, submit_time = low['prep'], low['time_start']
         # try:
-        ht = request_client("Sm", self.setting.low_llm, prep)
+        ht, finish_time = low['future'].result()
         # except:
         #     return
-        finish_time = time.time()
 
         self.replay.log("ai.mov_infer",
                         {"prep": prep, "ret": ht, "time_start": submit_time, "time_end": finish_time})
@@ -955,6 +1011,10 @@ class NEAagent:
         self._mov_hist.append({'task': str(self._task), 'status': 'Ongoing. Initiated.',
                                'submit_time': submit_time, 'finish_time': finish_time})
 
+    def _low_level_request(self, prep: dict):
+        ht = request_client("Sm", self.setting.low_llm, prep)
+        return ht, time.time()
+
     def _check_interrupt(self):
         # check llm incoming
         if self._llm_hist and self._lt_time < self._llm_hist[-1]['finish_time']:
@@ -971,6 +1031,7 @@ class NEAagent:
                 if self._mov_hist and self._mov_hist[-1]['status'].startswith('Ongoing'):
                     self._mov_hist[-1]['status'] = 'Interrupted. '
                 self._task = None
+                self._low = None
         if self._int_hist and self._int_hist[-1]['finish_time'] is not None \
                 and self._it_time < self._int_hist[-1]['finish_time']:
             self._it_time = self._int_hist[-1]['finish_time']
@@ -978,6 +1039,7 @@ class NEAagent:
                 if self._mov_hist and self._mov_hist[-1]['status'].startswith('Ongoing'):
                     self._mov_hist[-1]['status'] = 'Interrupted. '
                 self._task = None
+                self._low = None
 
         return chat
 
@@ -1010,8 +1072,9 @@ class NEAagent:
         while True:
             if self._task is None:
                 self.low_level_infer()
-            if self._task is None:
-                continue
+            if self._task is None:  # move not scored yet, keep still
+                self._lock.release()
+                return (0, 0), chat
 
             move_map = dict(left=(-1, 0), right=(1, 0),
                             up=(0, 1), down=(0, -1))
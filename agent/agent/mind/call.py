@@ -271,6 +271,14 @@ If the demand contains "Focus xxx", "Keep xxx" or "Always xxx", then you should
     return prompts, choices, available_moves, prob_base
 
 
+def Em_prompt_key(prep: dict) -> tuple:
+    # everything Em_prompt_ep reads from prep, equal keys give the same scores
+    moves = tuple((m[0], bool(m[1]), m[4]) for m in prep['chk_moves'])
+    llm = prep['llm_hist'][-1]['ret']
+    tasks = tuple(a['task'] for a in prep['mov_hist'])
+    return moves, llm['Demand'], llm['Chat'], tasks
+
+
 def L1_prompt_ep(prep: dict):
     chk_moves = prep['chk_moves']
     order_prep = prep['order']
@@ -479,11 +487,14 @@ If the demand contains "Focus xxx", "Keep xxx" or "Always xxx", then you should
     return prompts, choices, chosen_actions, prob_base
 
 
+# LLAMA_ADDRESS may list several comma-separated nodes
 nodes = [
     {
-        'chat': f'http://{os.environ["LLAMA_ADDRESS"]}/api/v1/chat',
-        'chateval': f'http://{os.environ["LLAMA_ADDRESS"]}/api/v1/chateval'
-    },
+        'chat': f'http://{address}/api/v1/chat',
+        'chateval': f'http://{address}/api/v1/chateval',
+        'model': f'http://{address}/api/v1/model'
+    }
+    for address in os.environ["LLAMA_ADDRESS"].split(',')
 ]
 LLM_LOCAL = LLM_LLAMA_LOCAL(nodes)
 LLM_HIGH_3 = LLM_GPT_API(
@@ -1,4 +1,6 @@
+import asyncio
 import requests as rq
+from concurrent.futures import Future, ThreadPoolExecutor
 from openai import OpenAI
 import time
 import threading
@@ -101,37 +103,124 @@ class LLM_GPT_API(LLM):
         return None
 
 
+class NodeRouter:
+    """
+    Picks a node for each local LLM call: the healthy node with the fewest
+    calls in flight, ties broken by the EWMA of its latency. A node that fails
+    MAX_FAILURES calls in a row is ejected, and probed every PROBE_INTERVAL
+    seconds until its health check passes again.
+    """
+    MAX_IN_FLIGHT = 4
+    MAX_FAILURES = 3
+    PROBE_INTERVAL = 5
+    PROBE_TIMEOUT = 3
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, nodes: list):
+        self.nodes = nodes
+        self.cond = threading.Condition()
+
+        self.in_flight = [0 for _ in self.nodes]
+        self.latency = [0. for _ in self.nodes]
+        self.failures = [0 for _ in self.nodes]
+        self.healthy = [True for _ in self.nodes]
+
+    def acquire(self) -> int:
+        with self.cond:
+            while True:
+                idxs = [i for i in range(len(self.nodes))
+                        if self.healthy[i] and self.in_flight[i] < self.MAX_IN_FLIGHT]
+                if idxs:
+                    idx = min(idxs, key=lambda i: (self.in_flight[i], self.latency[i]))
+                    self.in_flight[idx] += 1
+                    return idx
+                self.cond.wait()
+
+    def release(self, idx: int, latency: float, ok: bool):
+        with self.cond:
+            self.in_flight[idx] -= 1
+            if ok:
+                self.failures[idx] = 0
+                self.latency[idx] += self.EWMA_ALPHA * (latency - self.latency[idx])
+            else:
+                self.failures[idx] += 1
+                if self.healthy[idx] and self.failures[idx] >= self.MAX_FAILURES:
+                    print(f"LLM node ejected: {self.nodes[idx]['model']}")
+                    self.healthy[idx] = False
+                    thread = threading.Thread(target=self._probe, args=(idx,))
+                    thread.daemon = True
+                    thread.start()
+            self.cond.notify_all()
+
+    def _probe(self, idx: int):
+        while True:
+            time.sleep(self.PROBE_INTERVAL)
+            try:
+                rq.get(self.nodes[idx]['model'], timeout=self.PROBE_TIMEOUT).raise_for_status()
+            except Exception:
+                continue
+
+            with self.cond:
+                print(f"LLM node recovered: {self.nodes[idx]['model']}")
+                self.failures[idx] = 0
+                self.healthy[idx] = True
+                self.cond.notify_all()
+            return
+
+
 class LLM_LLAMA_LOCAL(LLM):
     MAX_RETRY_TIMES = 5
+    CONNECT_TIMEOUT = 5
+    READ_TIMEOUT = 60
+    MAX_WORKERS = 8
 
     def __init__(self, nodes: list):
         self.present = 'LLaMA-Precise'
         self.nodes = nodes
 
         # concurrency control
-        self.lock = threading.Lock()
-        self.sema = threading.Semaphore(len(self.nodes))
-        self.avail_list = [True for _ in range(len(self.nodes))]
+        self.router = NodeRouter(self.nodes)
 
-    def _infer(self, func: str, data: dict):
-        self.sema.acquire()
-        with self.lock:
-            idx = self.avail_list.index(True)
-            self.avail_list[idx] = False
+        # keep-alive connections, one pool per node
+        self.sessions = []
+        for _ in self.nodes:
+            session = rq.Session()
+            adapter = rq.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=NodeRouter.MAX_IN_FLIGHT)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.sessions.append(session)
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
 
-        if func == 'chat':
-            api = self.nodes[idx]['chat']
-        elif func == 'chateval':
-            api = self.nodes[idx]['chateval']
-        else:
+    def _infer(self, func: str, data: dict):
+        if func not in ['chat', 'chateval']:
             raise NotImplementedError
-        response = rq.post(api, json=data)
 
-        with self.lock:
-            self.avail_list[idx] = True
-        self.sema.release()
+        idx = self.router.acquire()
+        start_time = time.time()
+        ok = False
+        try:
+            api = self.nodes[idx][func]
+            response = self.sessions[idx].post(api, json=data, timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
+            response.raise_for_status()
+            ok = True
+        finally:
+            self.router.release(idx, time.time() - start_time, ok)
         return response
 
+    def eval_prob_async(self, prompt: list[list[str]], choice: list[str]) -> Future:
+        """Runs eval_prob on the client's pool. Cancel the future to drop it before it is sent."""
+        return self.executor.submit(self.eval_prob, prompt, choice)
+
+    def chat_async(self, inp: str, history: list) -> Future:
+        """Runs _chat on the client's pool. Cancel the future to drop it before it is sent."""
+        return self.executor.submit(self._chat, inp, history)
+
+    async def aeval_prob(self, prompt: list[list[str]], choice: list[str]):
+        return await asyncio.wrap_future(self.eval_prob_async(prompt, choice))
+
+    async def achat(self, inp: str, history: list) -> str:
+        return await asyncio.wrap_future(self.chat_async(inp, history))
+
     def _chat(self, inp: str, history: list) -> str:
         data = {
             "user_input": inp,
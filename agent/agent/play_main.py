@@ -29,11 +29,11 @@ def parse_arguments():
     return parser.parse_args()
 
 
-def init_env_replay(map_name, agent_name):
+def init_env_replay(map_name, agent_name, filename=None):
     map_set = MapSetting(**MAP_SETTINGS[map_name])
     agent_set = AgentSetting(agent_name, speed=2.5 if map_name != 'quick' else 3.5)
     
-    replay = Replay()
+    replay = Replay(filename)
 
     env = OvercookedEnvironment(map_set)
     env.reset()
@@ -51,15 +51,19 @@ def init_env_replay(map_name, agent_name):
 if __name__ == '__main__':
     arglist = parse_arguments()
 
-    # initialize replay
-    game, env, replay = init_env_replay(arglist.map, arglist.agent)
+    # initialize replay, streamed to disk while playing
+    repdir = Path(__file__).resolve().parent / 'replay'
+    game, env, replay = init_env_replay(
+        arglist.map, arglist.agent,
+        repdir / f'{arglist.map}-{arglist.agent}-{datetime.now().strftime("%Y%m%d_%H%M%S")}.rep')
 
     # play
-    ok = game.on_execute()
+    try:
+        ok = game.on_execute()
+    finally:
+        replay.close()
     
     print(replay['order_result'])
-    repdir = Path(__file__).resolve().parent / 'replay'
-    replay.save(repdir / f'{arglist.map}-{arglist.agent}-{datetime.now().strftime("%Y%m%d_%H%M%S")}.rep')
 
     # record
     if ok is True:
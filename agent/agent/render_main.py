@@ -0,0 +1,89 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')   # no window, frames are drawn on a hidden surface
+
+from gym_cooking.misc.game.gameimage import GameImage
+from gym_cooking.utils.replay import Replay
+from agent.resim_main import init_env
+
+import argparse
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Offline replay rendering")
+    parser.add_argument("--replay", type=str, nargs='*', help="replay files, defaults to every .rep file of --dir")
+    parser.add_argument("--dir", type=str, default=str(Path(__file__).resolve().parent / 'replay'),
+                        help="directory of .rep files")
+    parser.add_argument("--out", type=str, default=None, help="video directory, defaults to --dir")
+    parser.add_argument("--fps", type=float, default=10, help="the game steps at 10 fps, 20 for 2X speed")
+    parser.add_argument("--ffmpeg", type=str, default='ffmpeg')
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="0 to run in this process")
+
+    return parser.parse_args()
+
+
+def encoder_command(ffmpeg, size, fps, filename):
+    # raw rgb24 frames on stdin
+    return [ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{size[0]}x{size[1]}', '-framerate', str(fps), '-i', '-',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', str(filename)]
+
+
+def render(path, out_dir, fps=10, ffmpeg='ffmpeg') -> dict:
+    """Re-simulates a replay and draws a frame for each of its on_render
+    records, the frames are piped to an encoder process."""
+    start = time.time()
+    replay = Replay.from_file(path)
+    env = init_env(replay)
+    game = GameImage(env)
+    game.on_init()
+
+    filename = Path(out_dir) / (Path(path).stem + '.mp4')
+    encoder = subprocess.Popen(encoder_command(ffmpeg, (game.width, game.height), fps, filename),
+                               stdin=subprocess.PIPE)
+    frames = 0
+    try:
+        # the game draws once before logging anything, see GamePlayReply.on_execute
+        game.on_render(paused=False, replay=True)
+        encoder.stdin.write(game.get_frame())
+        frames += 1
+        for record in replay:
+            if record['name'] == 'env.step':
+                env.step(**record['args'], observe=False)
+            elif record['name'] == 'on_render':
+                game.on_render(replay=True, **record['args'])
+                encoder.stdin.write(game.get_frame())
+                frames += 1
+    finally:
+        encoder.stdin.close()
+        code = encoder.wait()
+        game.on_cleanup()
+    if code != 0:
+        raise RuntimeError(f"{ffmpeg} exited with code {code} while encoding {filename}")
+
+    return {'replay': Path(path).name, 'video': str(filename), 'frames': frames,
+            'redraws': game.redraws, 'seconds': time.time() - start}
+
+
+if __name__ == '__main__':
+    arglist = parse_arguments()
+
+    paths = [Path(arglist.dir) / p for p in arglist.replay] if arglist.replay \
+        else sorted(Path(arglist.dir).glob('*.rep'))
+    out_dir = Path(arglist.out or arglist.dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    job = partial(render, out_dir=out_dir, fps=arglist.fps, ffmpeg=arglist.ffmpeg)
+    if arglist.workers > 0:
+        with ProcessPoolExecutor(max_workers=arglist.workers) as executor:
+            rows = list(executor.map(job, paths))
+    else:
+        rows = [job(path) for path in paths]
+
+    for row in rows:
+        print(f"{row['replay']} -> {row['video']}: {row['frames']} frames, "
+              f"{row['redraws']} world redraws in {row['seconds']:.1f}s")
@@ -16,6 +16,7 @@ def parse_arguments():
     parser = argparse.ArgumentParser("Overcooked argument parser")
 
     parser.add_argument("--replay", type=str)
+    parser.add_argument("--start", type=float, default=0., help="seconds into the replay to start from")
 
     return parser.parse_args()
 
@@ -24,7 +25,7 @@ def init_env_replay(replay):
     map_set = replay['set_map']
     agent_set = replay['set_agent']
     
-    print(replay['order_result'])
+    print(replay.get('order_result'))   # missing if the game did not end
 
     env = OvercookedEnvironment(map_set)
     env.reset()
@@ -44,6 +45,8 @@ if __name__ == '__main__':
 
     # initialize replay
     game, env, replay = init_env_replay(replay)
+    if arglist.start > 0:
+        game.seek(arglist.start)
 
     # play
     ok = game.on_execute()
@@ -0,0 +1,111 @@
+from gym_cooking.utils.core import Fire
+from gym_cooking.utils.replay import Replay
+from gym_cooking.envs.overcooked_environment import OvercookedEnvironment
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+AI_RECORDS = {'ai.int_infer': 'int', 'ai.llm_infer': 'llm', 'ai.mov_infer': 'mov'}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Headless replay re-simulation")
+    parser.add_argument("--dir", type=str, default=str(Path(__file__).resolve().parent / 'replay'),
+                        help="directory of .rep files")
+    parser.add_argument("--out", type=str, default=None, help="metrics file, defaults to <dir>/metrics.npz")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="0 to run in this process")
+
+    return parser.parse_args()
+
+
+def init_env(replay):
+    # same environment as replay_main, without rendering
+    env = OvercookedEnvironment(replay['set_map'], headless=True)
+    env.reset()
+    env.order_scheduler.assign_rand_recipe_list(replay['order_rand'])
+    env.assign_chg_rand_list(replay['chg_rand'])
+    return env
+
+
+def resimulate(path) -> dict:
+    """Steps the environment through the env.step records of a replay as fast
+    as possible, and returns the metrics of the episode."""
+    start = time.time()
+    replay = Replay.from_file(path)
+    env = init_env(replay)
+    names = [agent.name for agent in env.sim_agents]
+
+    idle = dict.fromkeys(names, 0)
+    latency = {kind: [] for kind in AI_RECORDS.values()}
+    fires = 0
+    on_fire = set()     # pots holding a fire
+    for record in replay:
+        if record['name'] == 'env.step':
+            env.step(**record['args'], observe=False)
+            for name, action in record['args']['action_dict'].items():
+                idle[name] += tuple(action) == (0, 0)
+            pots = {pot.location for pot in env.world.get_all_gridsquares('Pot')
+                    if pot.holding is not None and any(isinstance(c, Fire) for c in pot.holding.contents)}
+            fires += len(pots - on_fire)
+            on_fire = pots
+        elif record['name'] in AI_RECORDS:
+            args = record['args']
+            latency[AI_RECORDS[record['name']]].append(args['time_end'] - args['time_start'])
+
+    order_scheduler = env.order_scheduler
+    result = dict(success=order_scheduler.successful_orders,
+                  fail=order_scheduler.failed_orders,
+                  reward=order_scheduler.reward)
+    recorded = replay.get('order_result')
+    agent_set = replay.get('set_agent')
+
+    metrics = {
+        'replay': Path(path).name,
+        'map': replay['set_map'].level,
+        'agent': agent_set.mode if agent_set is not None else '',
+        'steps': env.t,
+        'game_time': env.current_time,
+        **result,
+        'match': recorded == result,
+        'recorded': recorded is not None,
+        'fires': fires,
+        # agent 1 is the ai and agent 2 the human, see GamePlay.idx_human
+        'idle_ai': idle[names[0]],
+        'idle_human': idle[names[1]],
+    }
+    for kind, values in latency.items():
+        metrics[f'{kind}_calls'] = len(values)
+        metrics[f'{kind}_latency_mean'] = float(np.mean(values)) if values else np.nan
+        metrics[f'{kind}_latency_max'] = float(np.max(values)) if values else np.nan
+    metrics['resim_seconds'] = time.time() - start
+    return metrics
+
+
+def save_metrics(filename, rows: list[dict]):
+    # one array per column, load with dict(np.load(filename))
+    np.savez_compressed(filename, **{k: np.array([row[k] for row in rows]) for k in rows[0]})
+
+
+if __name__ == '__main__':
+    arglist = parse_arguments()
+
+    paths = sorted(Path(arglist.dir).glob('*.rep'))
+    if arglist.workers > 0:
+        with ProcessPoolExecutor(max_workers=arglist.workers) as executor:
+            rows = list(executor.map(resimulate, paths))
+    else:
+        rows = [resimulate(path) for path in paths]
+
+    for row in rows:
+        status = 'ok' if row['match'] else ('MISMATCH' if row['recorded'] else 'no order_result')
+        print(f"{row['replay']}: {row['success']} served, {row['fail']} failed, reward {row['reward']}, "
+              f"{row['fires']} fires, {row['steps']} steps in {row['resim_seconds']:.2f}s [{status}]")
+    if rows:
+        out = arglist.out or str(Path(arglist.dir) / 'metrics.npz')
+        save_metrics(out, rows)
+        print(f"{sum(row['match'] for row in rows)}/{len(rows)} order results match, metrics saved to {out}")
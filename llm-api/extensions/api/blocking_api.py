@@ -4,6 +4,7 @@ from copy import deepcopy
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from threading import Thread
 
+from extensions.api.scheduler import Scheduler
 from extensions.api.util import build_parameters, try_start_cloudflared
 from modules import shared
 from modules.chat import generate_chat_reply, generate_chat_prompt
@@ -16,18 +17,122 @@ from modules.models_settings import (
 from modules.text_generation import (
     encode,
     generate_reply,
+    get_token_ids,
     stop_everything_event
 )
+from modules.token_trie import TokenTrie
 from modules.utils import get_available_models
 
 def calc_perplexity_v2(prompts, pre_idx=1):
-    encs = [encode(p, add_special_tokens=False) for p in prompts]
-    
-    result = shared.model.call_perplexity(encs, pre_idx)
-    
+    return calc_perplexity_batch([prompts], pre_idx)[0]
+
+
+def calc_perplexity_batch(prompt_lists, pre_idx=1):
+    """
+    Scores several chateval requests at once. Requests whose bare prompts share
+    the same prefix are merged into a single trie and scored together.
+    """
+    groups = {}
+    for n, prompts in enumerate(prompt_lists):
+        # generate_chat_prompt has already tokenized these prompts for its length check,
+        # so the memoized ids are reused here with the bos token dropped
+        encs = [get_token_ids(p) for p in prompts]
+        encs = [enc[1:] if enc[:1] == (shared.tokenizer.bos_token_id,) else enc for enc in encs]
+
+        # the last pre_idx + 1 tokens of the bare prompt stay in every suffix,
+        # since appending a choice may change how they are tokenized
+        orig_len = len(encs[0])
+        var_idx = max(0, orig_len - pre_idx - 1)
+
+        prefix = encs[0][:var_idx]
+        suffixes = [list(enc[var_idx:]) for enc in encs]
+        groups.setdefault(prefix, []).append((n, suffixes))
+
+    result = [None] * len(prompt_lists)
+    for prefix, members in groups.items():
+        suffixes = [s for _, sufs in members for s in sufs]
+        logits = shared.model.call_perplexity(list(prefix), TokenTrie.build(suffixes), len(suffixes))
+
+        start = 0
+        for n, sufs in members:
+            result[n] = [dict(len=len(s) - 1, logit=l) for s, l in zip(sufs, logits[start:start + len(sufs)])]
+            start += len(sufs)
+
     return result
 
 
+def build_chateval_prompts(body):
+    generate_params = build_parameters(body, chat=True)
+    generate_params['stream'] = False
+
+    prompts = []
+
+    p = generate_chat_prompt("", generate_params, regenerate=False, _continue=True, history=generate_params['history'])
+    prompts.append(p)
+
+    for choice in body.get('choices', []):
+        history = deepcopy(generate_params['history'])
+        history['internal'][-1][-1] += choice
+        history['visible'][-1][-1] += choice
+
+        p = generate_chat_prompt("", generate_params, regenerate=False, _continue=True, history=history)
+        prompts.append(p)
+
+    return prompts
+
+
+def run_chateval(bodies):
+    with shared.generation_lock:
+        prompt_lists = [build_chateval_prompts(body) for body in bodies]
+        return calc_perplexity_batch(prompt_lists)
+
+
+def run_generate(bodies):
+    answers = []
+    for body in bodies:
+        prompt = body['prompt']
+        generate_params = build_parameters(body)
+        stopping_strings = generate_params.pop('stopping_strings')
+        generate_params['stream'] = False
+
+        generator = generate_reply(
+            prompt, generate_params, stopping_strings=stopping_strings, is_chat=False)
+
+        answer = ''
+        for a in generator:
+            answer = a
+
+        answers.append(answer)
+
+    return answers
+
+
+def chat_reply(body):
+    user_input = body['user_input']
+    regenerate = body.get('regenerate', False)
+    _continue = body.get('_continue', False)
+
+    generate_params = build_parameters(body, chat=True)
+    generate_params['stream'] = False
+
+    generator = generate_chat_reply(
+        user_input, generate_params, regenerate=regenerate, _continue=_continue, loading_message=False)
+
+    answer = generate_params['history']
+    for a in generator:
+        answer = a
+
+    return answer
+
+
+def run_chat(bodies):
+    return [chat_reply(body) for body in bodies]
+
+
+# owns the model for generate, chat and chateval requests; created in start_server
+scheduler = None
+
+
 def get_model_info():
     return {
         'model_name': shared.model_name,
@@ -47,6 +152,17 @@ class Handler(BaseHTTPRequestHandler):
                 'result': shared.model_name
             })
 
+            self.wfile.write(response.encode('utf-8'))
+        elif self.path == '/api/v1/prefix-cache':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+
+            prefix_cache = getattr(shared.model, 'prefix_cache', None)
+            response = json.dumps({
+                'result': prefix_cache.stats() if prefix_cache is not None else None
+            })
+
             self.wfile.write(response.encode('utf-8'))
         else:
             self.send_error(404)
@@ -60,17 +176,7 @@ class Handler(BaseHTTPRequestHandler):
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
 
-            prompt = body['prompt']
-            generate_params = build_parameters(body)
-            stopping_strings = generate_params.pop('stopping_strings')
-            generate_params['stream'] = False
-
-            generator = generate_reply(
-                prompt, generate_params, stopping_strings=stopping_strings, is_chat=False)
-
-            answer = ''
-            for a in generator:
-                answer = a
+            answer = scheduler.submit('generate', body).result()
 
             response = json.dumps({
                 'results': [{
@@ -85,19 +191,11 @@ class Handler(BaseHTTPRequestHandler):
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
 
-            user_input = body['user_input']
-            regenerate = body.get('regenerate', False)
-            _continue = body.get('_continue', False)
-
-            generate_params = build_parameters(body, chat=True)
-            generate_params['stream'] = False
-
-            generator = generate_chat_reply(
-                user_input, generate_params, regenerate=regenerate, _continue=_continue, loading_message=False)
-
-            answer = generate_params['history']
-            for a in generator:
-                answer = a
+            if getattr(shared.model, 'batch_generator', None) is not None:
+                # decoded together with the other chats in flight, so it doesn't wait for the scheduler
+                answer = chat_reply(body)
+            else:
+                answer = scheduler.submit('chat', body).result()
 
             response = json.dumps({
                 'results': [{
@@ -112,24 +210,7 @@ class Handler(BaseHTTPRequestHandler):
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
 
-            generate_params = build_parameters(body, chat=True)
-            generate_params['stream'] = False
-            
-            prompts = []
-
-            p = generate_chat_prompt("", generate_params, regenerate=False, _continue=True, history=generate_params['history'])
-            prompts.append(p)
-
-            for choice in body.get('choices', []):
-                history = deepcopy(generate_params['history'])
-                history['internal'][-1][-1] += choice
-                history['visible'][-1][-1] += choice
-
-                p = generate_chat_prompt("", generate_params, regenerate=False, _continue=True, history=history)
-                prompts.append(p)
-            
-            ret = calc_perplexity_v2(prompts)
-
+            ret = scheduler.submit('chateval', body).result()
 
             response = json.dumps({
                 'ret': ret
@@ -261,4 +342,12 @@ def _run_server(port: int, share: bool = False, tunnel_id=str):
 
 
 def start_server(port: int, share: bool = False, tunnel_id=str):
+    global scheduler
+    scheduler = Scheduler({
+        'generate': run_generate,
+        'chat': run_chat,
+        'chateval': run_chateval,
+    }, shared.args.api_batch_wait / 1000, shared.args.api_max_batch)
+    scheduler.start()
+
     Thread(target=_run_server, args=[port, share, tunnel_id], daemon=True).start()
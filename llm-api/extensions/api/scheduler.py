@@ -0,0 +1,74 @@
+import queue
+import time
+import traceback
+from concurrent.futures import Future
+from threading import Thread
+from typing import Callable
+
+
+class Scheduler:
+    '''
+    Owns the model on a single thread. Handlers queue requests with submit()
+    and wait on the returned future. The scheduler thread gathers requests for
+    up to `wait` seconds into a micro-batch, then hands every request of the
+    same kind to its runner in one call, so that the runner can merge the
+    compatible ones.
+
+    A runner takes a list of request payloads and returns one result per
+    payload, in the same order.
+    '''
+
+    def __init__(self, runners: dict[str, Callable], wait: float, max_batch: int):
+        self.runners = runners
+        self.wait = wait
+        self.max_batch = max(1, max_batch)
+        self.queue = queue.Queue()
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+
+    def submit(self, kind: str, payload) -> Future:
+        if kind not in self.runners:
+            raise KeyError(kind)
+
+        future = Future()
+        self.queue.put((kind, payload, future))
+        return future
+
+    def _gather(self) -> list:
+        jobs = [self.queue.get()]
+        deadline = time.time() + self.wait
+        while len(jobs) < self.max_batch:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+
+            try:
+                jobs.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._gather()
+
+            # group by kind, keeping arrival order within each group
+            groups = {}
+            for kind, payload, future in jobs:
+                groups.setdefault(kind, []).append((payload, future))
+
+            for kind, group in groups.items():
+                payloads = [payload for payload, _ in group]
+                try:
+                    results = self.runners[kind](payloads)
+                except Exception as e:
+                    traceback.print_exc()
+                    for _, future in group:
+                        future.set_exception(e)
+
+                    continue
+
+                for (_, future), result in zip(group, results):
+                    future.set_result(result)
@@ -41,6 +41,7 @@ def add_lora_exllama(lora_names):
             shared.model.generator.lora = None
         else:
             shared.model.lora = None
+            shared.model.prefix_cache.clear()
 
         shared.lora_names = []
         return
@@ -59,6 +60,7 @@ def add_lora_exllama(lora_names):
         else:
             lora = ExLlamaLora(shared.model.ex_model, str(lora_config_path), str(lora_adapter_path))
             shared.model.lora = lora
+            shared.model.prefix_cache.clear()
 
         shared.lora_names = [lora_names[0]]
         return
@@ -113,19 +113,29 @@ def generate_chat_prompt(user_input, state, **kwargs):
         )
 
     # Build the prompt
+    # While adding rows, the length is estimated from memoized per-row token
+    # counts instead of re-tokenizing the whole prompt. It is checked exactly
+    # once the rows are in place.
     rows = [context]
     min_rows = 3
     i = len(history) - 1
-    while i >= 0 and get_encoded_length(wrapper.replace('<|prompt|>', ''.join(rows))) < max_length:
+    length = get_encoded_length(wrapper.replace('<|prompt|>', '')) + get_encoded_length(context, add_special_tokens=False)
+    while i >= 0 and length < max_length:
         if _continue and i == len(history) - 1:
             if state['mode'] != 'chat-instruct':
-                rows.insert(1, substrings['bot_turn_stripped'] + history[i][1].strip())
+                row = substrings['bot_turn_stripped'] + history[i][1].strip()
+                rows.insert(1, row)
+                length += get_encoded_length(row, add_special_tokens=False)
         else:
-            rows.insert(1, substrings['bot_turn'].replace('<|bot-message|>', history[i][1].strip()))
+            row = substrings['bot_turn'].replace('<|bot-message|>', history[i][1].strip())
+            rows.insert(1, row)
+            length += get_encoded_length(row, add_special_tokens=False)
 
         string = history[i][0]
         if string not in ['', '<|BEGIN-VISIBLE-CHAT|>']:
-            rows.insert(1, replace_all(substrings['user_turn'], {'<|user-message|>': string.strip(), '<|round|>': str(i)}))
+            row = replace_all(substrings['user_turn'], {'<|user-message|>': string.strip(), '<|round|>': str(i)})
+            rows.insert(1, row)
+            length += get_encoded_length(row, add_special_tokens=False)
 
         i -= 1
 
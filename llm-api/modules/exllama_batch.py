@@ -0,0 +1,209 @@
+import queue
+import traceback
+from collections import deque
+from threading import Thread
+
+import torch
+
+from modules import shared
+from modules.logging_colors import logger
+
+try:
+    from exllama.model import ExLlamaCache
+except:
+    logger.warning('Exllama module failed to load. Will attempt to load from repositories.')
+    try:
+        from modules.relative_imports import RelativeImport
+
+        with RelativeImport("repositories/exllama"):
+            from model import ExLlamaCache
+    except:
+        logger.error("Could not find repositories/exllama/. Make sure that exllama is cloned inside repositories/ and is up to date.")
+        raise
+
+
+class BatchSequence:
+    def __init__(self, ids, state, max_new_tokens, is_done):
+        self.ids = ids
+        self.new_ids = []
+        self.state = state
+        self.max_new_tokens = max_new_tokens
+        self.is_done = is_done
+        self.updates = queue.Queue()
+
+
+class ExLlamaBatchGenerator:
+    '''
+    Continuous batching on top of ExLlama. All sequences share one batch cache
+    and one position counter, so a sequence is admitted at a token boundary by
+    prefilling its prompt to end at the current position, with the slots
+    before it masked out. Since RoPE only depends on relative positions, this
+    gives the same logits as decoding the sequence alone. Finished sequences
+    free their row immediately, and the position counter restarts once the
+    batch is empty.
+
+    A prompt longer than the current position has to wait until the batch
+    drains, and it blocks the queue behind it so that it cannot be starved.
+    '''
+
+    def __init__(self, owner, max_rows: int):
+        self.owner = owner
+        self.model = owner.ex_model
+        self.max_rows = max_rows
+        self.max_seq_len = self.model.config.max_seq_len
+
+        self.cache = ExLlamaCache(self.model, batch_size=max_rows)
+        self.mask = torch.zeros((max_rows, self.max_seq_len), dtype=torch.bool)
+        self.rows = [None] * max_rows
+        self.length = 0
+
+        self.pending = queue.Queue()
+        self.waiting = deque()
+        Thread(target=self._run, daemon=True).start()
+
+    @staticmethod
+    def supports(state):
+        '''Whether the sampler below implements every setting in state.'''
+        return state['num_beams'] == 1 and state['penalty_alpha'] == 0 and state['mirostat_mode'] == 0 \
+            and state['typical_p'] == 1 and state['tfs'] == 1 and state['top_a'] == 0 \
+            and state['epsilon_cutoff'] == 0 and state['eta_cutoff'] == 0 \
+            and state['encoder_repetition_penalty'] == 1 and state['no_repeat_ngram_size'] == 0 \
+            and state['min_length'] == 0 and state['guidance_scale'] == 1 and state['negative_prompt'] == ''
+
+    def generate(self, ids, state, max_new_tokens, is_done):
+        '''
+        Yields the list of generated ids after every new token. is_done is
+        called with that list on the generator thread and ends the sequence
+        when it returns True.
+        '''
+        seq = BatchSequence(ids, state, max_new_tokens, is_done)
+        self.pending.put(seq)
+        while True:
+            update = seq.updates.get()
+            if update is None:
+                return
+            elif isinstance(update, Exception):
+                raise update
+
+            yield update
+
+    @property
+    def num_active(self):
+        return sum(seq is not None for seq in self.rows)
+
+    def _run(self):
+        while True:
+            if self.num_active == 0 and len(self.waiting) == 0:
+                self.waiting.append(self.pending.get())
+
+            while not self.pending.empty():
+                self.waiting.append(self.pending.get_nowait())
+
+            try:
+                with shared.generation_lock, torch.no_grad():
+                    self._admit()
+                    if self.num_active > 0:
+                        self._step()
+            except Exception as e:
+                traceback.print_exc()
+                for row, seq in enumerate(self.rows):
+                    if seq is not None:
+                        seq.updates.put(e)
+                        self.rows[row] = None
+
+                self.length = 0
+
+    def _admit(self):
+        if self.num_active == 0:
+            # restart the batch at the longest prompt among those that fit together
+            self.length = 0
+            for n, seq in enumerate(self.waiting):
+                length = max(self.length, len(seq.ids))
+                if n >= self.max_rows or (n > 0 and length + seq.max_new_tokens > self.max_seq_len):
+                    break
+
+                self.length = length
+
+        while len(self.waiting) > 0 and None in self.rows:
+            seq = self.waiting[0]
+            if len(seq.ids) > self.length or (self.num_active > 0 and self.length + seq.max_new_tokens > self.max_seq_len):
+                break
+
+            self.waiting.popleft()
+            self._prefill(self.rows.index(None), seq)
+
+    def _prefill(self, row, seq):
+        self.rows[row] = seq
+        n = len(seq.ids)
+        start = self.length - n
+
+        cache = ExLlamaCache(self.model, max_seq_len=self.length)
+        cache.current_seq_len = start
+        input_mask = None
+        if start > 0:
+            input_mask = torch.zeros((1, self.length), dtype=torch.bool)
+            input_mask[0, start:] = True
+
+        logits = self.model.forward(torch.tensor([seq.ids], dtype=torch.long), cache, input_mask=input_mask, lora=self.owner.lora)
+        cache.copy_states(self.cache, start, n, start, n, 0, 1, row, 1)
+
+        self.mask[row] = False
+        self.mask[row, start:self.length] = True
+        self._accept(row, logits[0, -1])
+
+    def _step(self):
+        input_ids = torch.zeros((self.max_rows, 1), dtype=torch.long)
+        for row, seq in enumerate(self.rows):
+            if seq is not None:
+                input_ids[row, 0] = seq.new_ids[-1]
+
+        self.mask[:, self.length] = True
+        self.cache.current_seq_len = self.length
+        logits = self.model.forward(input_ids, self.cache, input_mask=self.mask[:, :self.length + 1], lora=self.owner.lora)
+        self.length += 1
+
+        for row, seq in enumerate(self.rows):
+            if seq is not None:
+                self._accept(row, logits[row, -1])
+
+        if self.num_active == 0:
+            self.length = 0
+
+    def _accept(self, row, logits):
+        seq = self.rows[row]
+        token = self.sample(logits.float(), seq.ids + seq.new_ids, seq.state)
+        seq.new_ids.append(token)
+        seq.updates.put(list(seq.new_ids))
+
+        if token == shared.tokenizer.eos_token_id or len(seq.new_ids) >= seq.max_new_tokens or self.length >= self.max_seq_len \
+                or shared.stop_everything or seq.is_done(seq.new_ids):
+            seq.updates.put(None)
+            self.rows[row] = None
+
+    def sample(self, logits, ids, state):
+        '''Same order as the transformers logits processors and warpers.'''
+        if state['repetition_penalty'] != 1 and len(ids) > 0:
+            context = ids[-state['repetition_penalty_range']:] if state['repetition_penalty_range'] > 0 else ids
+            index = torch.tensor(sorted(set(context)), dtype=torch.long, device=logits.device)
+            score = logits[index]
+            logits[index] = torch.where(score < 0, score * state['repetition_penalty'], score / state['repetition_penalty'])
+
+        if state['ban_eos_token']:
+            logits[shared.tokenizer.eos_token_id] = -float('inf')
+
+        if not state['do_sample'] or state['temperature'] == 0:
+            return int(torch.argmax(logits))
+
+        logits /= state['temperature']
+        if state['top_k'] > 0:
+            kth = torch.topk(logits, min(state['top_k'], logits.shape[-1])).values[-1]
+            logits[logits < kth] = -float('inf')
+
+        if state['top_p'] < 1:
+            sorted_logits, sorted_index = torch.sort(logits, descending=True)
+            probs = torch.softmax(sorted_logits, dim=-1)
+            remove = probs.cumsum(dim=-1) - probs > state['top_p']
+            logits[sorted_index[remove]] = -float('inf')
+
+        probs = torch.softmax(logits, dim=-1)
+        return int(torch.multinomial(probs, 1))
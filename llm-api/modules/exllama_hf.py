@@ -9,6 +9,7 @@ from transformers.modeling_outputs import CausalLMOutputWithPast
 
 from modules import RoPE, shared
 from modules.logging_colors import logger
+from modules.prefix_cache import PrefixCache
 
 try:
     from exllama.model import ExLlama, ExLlamaCache, ExLlamaConfig
@@ -34,11 +35,17 @@ class ExllamaHF(PreTrainedModel):
 
         self.ex_cache = ExLlamaCache(self.ex_model)
         self.past_seq = None
+        self.prefix_cache = PrefixCache(shared.args.prefix_cache_block, int(shared.args.prefix_cache_gb * 1024 ** 3))
 
         if shared.args.cfg_cache:
             self.ex_cache_negative = ExLlamaCache(self.ex_model)
             self.past_seq_negative = None
 
+        self.batch_generator = None
+        if shared.args.gen_batch_size > 1:
+            from modules.exllama_batch import ExLlamaBatchGenerator
+            self.batch_generator = ExLlamaBatchGenerator(self, shared.args.gen_batch_size)
+
     def _validate_model_class(self):
         pass
 
@@ -109,42 +116,96 @@ class ExllamaHF(PreTrainedModel):
 
         return CausalLMOutputWithPast(logits=logits, past_key_values=seq if use_cache else None, loss=loss)
 
-    def call_perplexity(self, encs, pre_idx):
-        orig_len = encs[0].shape[1]
-        var_idx = orig_len - pre_idx - 1
-        var_idx = max(0, var_idx)
-        
+    def call_perplexity(self, prefix, trie, num_seqs):
+        """
+        Returns the summed log-probs of every sequence stored in trie as a
+        continuation of prefix. The first token of each sequence is fed but not
+        scored. Every trie node goes through the model exactly once.
+        """
         ex_cache = self.ex_cache
-        ex_cache.current_seq_len = 0
-        
-        # orig
-        seq = encs[0][0].tolist()
-        self.ex_model.forward(torch.tensor([seq[:var_idx]], dtype=torch.long), ex_cache, preprocess_only=True, lora=self.lora)
-        temp_cache = ex_cache.clone()
-        temp_current_seq_len  = ex_cache.current_seq_len
-        
-        result = []
-        
-        for enc in encs:
-            ex_cache = temp_cache.clone()
-            ex_cache.current_seq_len = temp_current_seq_len
-            seq = enc[0].tolist()
-            logits = self.ex_model.forward(torch.tensor([seq[var_idx:-1]], dtype=torch.long), ex_cache, last_id_only=False, lora=self.lora)
-            
+        self.past_seq = None
+        self.prefill_cached(ex_cache, prefix)
+
+        scores = [0.0] * num_seqs
+        self.score_trie(ex_cache, trie, None, 0.0, scores)
+        return scores
+
+    def prefill_cached(self, ex_cache, seq):
+        """
+        Fills ex_cache with seq, taking as many leading blocks as possible from
+        the prefix cache and running the model only on the remaining tokens.
+        """
+        cache = self.prefix_cache
+        block = cache.block_size
+        keys = cache.block_keys(seq) if cache.enabled else []
+        found = cache.match(keys)
+
+        for i, states in enumerate(found):
+            states.copy_states(ex_cache, 0, block, i * block, block, 0, 1, 0, 1)
+
+        ex_cache.current_seq_len = len(found) * block
+        if ex_cache.current_seq_len < len(seq):
+            self.ex_model.forward(torch.tensor([seq[ex_cache.current_seq_len:]], dtype=torch.long), ex_cache, preprocess_only=True, lora=self.lora)
+
+        for i in range(len(found), len(keys)):
+            states = ExLlamaCache(self.ex_model, max_seq_len=block)
+            ex_cache.copy_states(states, i * block, block, 0, block, 0, 1, 0, 1)
+            nbytes = sum(t.numel() * t.element_size() for t in states.key_states + states.value_states)
+            cache.insert(keys[i], states, nbytes)
+
+        cache.record(len(found) * block, len(seq))
+
+    def score_trie(self, ex_cache, node, logs, base, scores):
+        """
+        Evaluates every outgoing edge of node in batched forward passes over
+        copies of ex_cache, then descends into the children that branch further.
+        Padding is on the right, so it never affects the logits of real tokens.
+        logs are the next-token log-probs at node, or None at the root.
+        """
+        prefix_len = ex_cache.current_seq_len
+        edges = node.edges()
+        batch_size = max(1, shared.args.eval_batch_size)
+
+        for start in range(0, len(edges), batch_size):
+            chunk = edges[start:start + batch_size]
+            bsz = len(chunk)
+            width = max(len(tokens) for tokens, _ in chunk)
+
+            batch_cache = ExLlamaCache(self.ex_model, batch_size=bsz, max_seq_len=prefix_len + width)
+            if prefix_len > 0:
+                ex_cache.copy_states(batch_cache, 0, prefix_len, 0, prefix_len, 0, 1, 0, bsz)
+            batch_cache.current_seq_len = prefix_len
+
+            input_ids = torch.zeros((bsz, width), dtype=torch.long)
+            for i, (tokens, _) in enumerate(chunk):
+                input_ids[i, :len(tokens)] = torch.tensor(tokens, dtype=torch.long)
+
+            logits = self.ex_model.forward(input_ids, batch_cache, last_id_only=False, lora=self.lora)
+
             assert len(logits.shape) == 3
-            assert logits.shape[0] == 1
-            assert len(enc.shape) == 2
-            assert enc.shape[0] == 1
-            logs = logits[0].to(device=enc.device)
-            logs -= torch.logsumexp(logs, dim=1, keepdim=True)
-            index = enc[0, var_idx + 1:].reshape(-1, 1)
-            logprob = torch.gather(logs, dim=1, index=index)
-            
-            result.append(dict(len=enc.shape[1] - var_idx - 1, logit=float(logprob.sum())))
-            # result.append(dict(len=enc.shape[1] - var_idx - 1, logit=logprob.flatten().tolist()))
-
-        return result
-    
+            assert logits.shape[0] == bsz
+
+            for i, (tokens, child) in enumerate(chunk):
+                n = len(tokens)
+                child_logs = logits[i, :n].float()
+                child_logs -= torch.logsumexp(child_logs, dim=1, keepdim=True)
+
+                score = base
+                if logs is not None:
+                    score += float(logs[tokens[0]])
+                if n > 1:
+                    index = torch.tensor(tokens[1:], dtype=torch.long, device=child_logs.device).reshape(-1, 1)
+                    score += float(torch.gather(child_logs[:-1], dim=1, index=index).sum())
+
+                for idx in child.ends:
+                    scores[idx] = score
+
+                if len(child.children) > 0:
+                    batch_cache.copy_states(ex_cache, prefix_len, n, prefix_len, n, i, 1, 0, 1)
+                    ex_cache.current_seq_len = prefix_len + n
+                    self.score_trie(ex_cache, child, child_logs[-1], score, scores)
+                    ex_cache.current_seq_len = prefix_len
+
     @classmethod
     def from_pretrained(cls, pretrained_model_name_or_path: Optional[Union[str, os.PathLike]], *model_args, **kwargs):
         assert len(model_args) == 0 and len(kwargs) == 0, "extra args is currently not supported"
@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+
+class PrefixCache:
+    '''
+    LRU store for the key/value states of prompt prefixes, split in blocks of
+    block_size tokens. A block is keyed by a hash of every token up to its end,
+    so it is only reused behind the exact same prefix. The states themselves are
+    opaque to this class; the loader decides what to store and how to copy it.
+    '''
+
+    def __init__(self, block_size: int, max_bytes: int):
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+
+        self.blocks = OrderedDict()  # key -> (states, nbytes)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.hit_tokens = 0
+        self.prefilled_tokens = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.block_size > 0 and self.max_bytes > 0
+
+    def block_keys(self, seq: list) -> list:
+        '''Chained hashes of every full block of seq.'''
+        keys = []
+        digest = b''
+        for start in range(0, len(seq) - self.block_size + 1, self.block_size):
+            h = hashlib.blake2b(digest, digest_size=16)
+            h.update(array('q', seq[start:start + self.block_size]).tobytes())
+            digest = h.digest()
+            keys.append(digest)
+
+        return keys
+
+    def match(self, keys: list) -> list:
+        '''Returns the stored states of the longest run of leading cached blocks.'''
+        found = []
+        with self.lock:
+            for key in keys:
+                if key not in self.blocks:
+                    break
+
+                self.blocks.move_to_end(key)
+                found.append(self.blocks[key][0])
+
+        return found
+
+    def insert(self, key, states, nbytes: int):
+        with self.lock:
+            if key in self.blocks or nbytes > self.max_bytes:
+                return
+
+            self.blocks[key] = (states, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, n) = self.blocks.popitem(last=False)
+                self.total_bytes -= n
+                self.evictions += 1
+
+    def record(self, hit_tokens: int, total_tokens: int):
+        with self.lock:
+            self.requests += 1
+            if hit_tokens > 0:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+            self.hit_tokens += hit_tokens
+            self.prefilled_tokens += total_tokens - hit_tokens
+
+    def clear(self):
+        with self.lock:
+            self.blocks.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_tokens': self.hit_tokens,
+                'prefilled_tokens': self.prefilled_tokens,
+                'evictions': self.evictions,
+                'blocks': len(self.blocks),
+                'block_size': self.block_size,
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -149,6 +149,10 @@ parser.add_argument('--disable_exllama', action='store_true', help='Disable ExLl
 parser.add_argument('--gpu-split', type=str, help="Comma-separated list of VRAM (in GB) to use per GPU device for model layers, e.g. 20,7,7")
 parser.add_argument('--max_seq_len', type=int, default=2048, help="Maximum sequence length.")
 parser.add_argument('--cfg-cache', action='store_true', help="ExLlama_HF: Create an additional cache for CFG negative prompts. Necessary to use CFG with that loader, but not necessary for CFG with base ExLlama.")
+parser.add_argument('--eval-batch-size', type=int, default=8, help="ExLlama_HF: Number of chateval choices scored together in one forward pass. Each one holds its own copy of the prompt cache, so lower it if you run out of VRAM.")
+parser.add_argument('--prefix-cache-gb', type=float, default=2, help="ExLlama_HF: Memory budget in GB for keeping prompt prefixes between chateval requests. Set to 0 to disable.")
+parser.add_argument('--prefix-cache-block', type=int, default=128, help="ExLlama_HF: Number of tokens per prefix cache block.")
+parser.add_argument('--gen-batch-size', type=int, default=0, help="ExLlama_HF: Number of sequences decoded together by continuous batching. Each one holds a full max_seq_len cache. Set to 2 or more to enable.")
 
 # DeepSpeed
 parser.add_argument('--deepspeed', action='store_true', help='Enable the use of DeepSpeed ZeRO-3 for inference via the Transformers integration.')
@@ -181,6 +185,8 @@ parser.add_argument('--api-blocking-port', type=int, default=5000, help='The lis
 parser.add_argument('--api-streaming-port', type=int, default=5005, help='The listening port for the streaming API.')
 parser.add_argument('--public-api', action='store_true', help='Create a public URL for the API using Cloudfare.')
 parser.add_argument('--public-api-id', type=str, help='Tunnel ID for named Cloudflare Tunnel. Use together with public-api option.', default=None)
+parser.add_argument('--api-batch-wait', type=float, default=5, help='Time in milliseconds the blocking API waits to gather concurrent requests into one micro-batch.')
+parser.add_argument('--api-max-batch', type=int, default=16, help='Maximum number of requests in one blocking API micro-batch.')
 
 # Multimodal
 parser.add_argument('--multimodal-pipeline', type=str, default=None, help='The multimodal pipeline to use. Examples: llava-7b, llava-13b.')
@@ -1,5 +1,6 @@
 import ast
 import copy
+import functools
 import html
 import random
 import re
@@ -24,6 +25,14 @@ from modules.models import clear_torch_cache, local_rank
 
 
 def generate_reply(*args, **kwargs):
+    state = args[1] if len(args) > 1 else kwargs['state']
+    if use_batch_generator(state):
+        # the batch generator takes the lock itself, one decoding step at a time
+        for result in _generate_reply(*args, **kwargs):
+            yield result
+
+        return
+
     shared.generation_lock.acquire()
     try:
         for result in _generate_reply(*args, **kwargs):
@@ -44,6 +53,8 @@ def _generate_reply(question, state, stopping_strings=None, is_chat=False, escap
 
         if shared.model.__class__.__name__ in ['LlamaCppModel', 'RWKVModel', 'ExllamaModel', 'CtransformersModel']:
             generate_func = generate_reply_custom
+        elif use_batch_generator(state):
+            generate_func = generate_reply_batched
         else:
             generate_func = generate_reply_HF
 
@@ -105,6 +116,11 @@ def _generate_reply(question, state, stopping_strings=None, is_chat=False, escap
     yield reply
 
 
+def use_batch_generator(state):
+    batch_generator = getattr(shared.model, 'batch_generator', None)
+    return batch_generator is not None and batch_generator.supports(state) and apply_extensions('custom_generate_reply') is None
+
+
 def encode(prompt, add_special_tokens=True, add_bos_token=True, truncation_length=None):
     if shared.model.__class__.__name__ in ['LlamaCppModel', 'RWKVModel', 'CtransformersModel']:
         input_ids = shared.tokenizer.encode(str(prompt))
@@ -135,12 +151,33 @@ def decode(output_ids, skip_special_tokens=True):
     return shared.tokenizer.decode(output_ids, skip_special_tokens)
 
 
-def get_encoded_length(prompt):
+def get_token_ids(prompt, add_special_tokens=True):
+    '''
+    Memoized tokenization of a prompt, as a tuple of ids. The memo is dropped
+    whenever a different tokenizer gets loaded.
+    '''
+    global token_ids_tokenizer
+    if shared.tokenizer is not token_ids_tokenizer:
+        _get_token_ids.cache_clear()
+        token_ids_tokenizer = shared.tokenizer
+
+    return _get_token_ids(prompt, add_special_tokens)
+
+
+token_ids_tokenizer = None
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_token_ids(prompt, add_special_tokens):
+    return tuple(encode(prompt, add_special_tokens=add_special_tokens)[0].tolist())
+
+
+def get_encoded_length(prompt, add_special_tokens=True):
     length_after_extensions = apply_extensions('tokenized_length', prompt)
     if length_after_extensions is not None:
         return length_after_extensions
 
-    return len(encode(prompt)[0])
+    return len(get_token_ids(prompt, add_special_tokens))
 
 
 def get_max_prompt_length(state):
@@ -339,6 +376,47 @@ def generate_reply_HF(question, original_question, seed, state, stopping_strings
         return
 
 
+def generate_reply_batched(question, original_question, seed, state, stopping_strings=None, is_chat=False):
+    """
+    For models with a batch generator: the reply is decoded together with
+    the other requests in flight
+    """
+    input_ids = encode(question, add_bos_token=state['add_bos_token'], truncation_length=get_max_prompt_length(state))
+    ids = input_ids[0].tolist()
+    if state['auto_max_new_tokens']:
+        max_new_tokens = state['truncation_length'] - len(ids)
+    else:
+        max_new_tokens = state['max_new_tokens']
+
+    all_stop_strings = []
+    for st in (stopping_strings, ast.literal_eval(f"[{state['custom_stopping_strings']}]")):
+        if type(st) is list and len(st) > 0:
+            all_stop_strings += st
+
+    def is_done(new_ids):
+        reply = get_reply_from_output_ids(ids + new_ids, input_ids, original_question, state, is_chat=is_chat)
+        return apply_stopping_strings(reply, all_stop_strings)[1]
+
+    t0 = time.time()
+    new_ids = []
+    try:
+        if not is_chat:
+            yield ''
+
+        for new_ids in shared.model.batch_generator.generate(ids, state, max_new_tokens, is_done):
+            if state['stream']:
+                yield get_reply_from_output_ids(ids + new_ids, input_ids, original_question, state, is_chat=is_chat)
+
+        yield get_reply_from_output_ids(ids + new_ids, input_ids, original_question, state, is_chat=is_chat)
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        t1 = time.time()
+        print(f'Output generated in {(t1-t0):.2f} seconds ({len(new_ids)/(t1-t0):.2f} tokens/s, {len(new_ids)} tokens, context {len(ids)}, seed {seed})')
+        return
+
+
 def generate_reply_custom(question, original_question, seed, state, stopping_strings=None, is_chat=False):
     """
     For models that do not use the transformers library for sampling
@@ -0,0 +1,37 @@
+class TokenTrie:
+    '''
+    Trie over token sequences. Every sequence that ends at a node is recorded
+    in ends by its index, so duplicates and sequences that are a prefix of
+    another one are both kept.
+    '''
+
+    def __init__(self):
+        self.children = {}
+        self.ends = []
+
+    @classmethod
+    def build(cls, seqs: list):
+        root = cls()
+        for idx, seq in enumerate(seqs):
+            node = root
+            for token in seq:
+                node = node.children.setdefault(token, cls())
+            node.ends.append(idx)
+
+        return root
+
+    def edges(self) -> list:
+        '''
+        Outgoing edges with chains of single-child nodes collapsed, as a list of
+        (tokens, node) where node is the one reached after the last token.
+        '''
+        edges = []
+        for token, node in self.children.items():
+            tokens = [token]
+            while len(node.children) == 1 and len(node.ends) == 0:
+                token, node = next(iter(node.children.items()))
+                tokens.append(token)
+
+            edges.append((tokens, node))
+
+        return edges
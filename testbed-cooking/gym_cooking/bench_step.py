@@ -0,0 +1,47 @@
+from gym_cooking.envs.overcooked_environment import OvercookedEnvironment, MapSetting
+
+import argparse
+import random
+import time
+
+ACTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0), (0, 0)]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Overcooked stepping benchmark")
+    parser.add_argument(
+        "--levels", type=str, nargs='+',
+        default=['new1', 'new2', 'new3', 'new4', 'new5']
+    )
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--passed-time", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+
+    return parser.parse_args()
+
+
+def bench(level, headless, steps, passed_time, seed):
+    # random actions for every agent, resetting whenever an episode ends
+    random.seed(seed)
+    rng = random.Random(seed)
+    env = OvercookedEnvironment(MapSetting(level=level), headless=headless)
+    env.reset()
+    names = [agent.name for agent in env.sim_agents]
+
+    start = time.time()
+    for _ in range(steps):
+        _, _, done, _ = env.step({name: rng.choice(ACTIONS) for name in names}, passed_time=passed_time)
+        if done:
+            env.reset()
+    return steps / (time.time() - start)
+
+
+if __name__ == '__main__':
+    arglist = parse_arguments()
+
+    print(f"{'level':<8}{'full':>12}{'headless':>12}{'speedup':>10}")
+    for level in arglist.levels:
+        full = bench(level, False, arglist.steps, arglist.passed_time, arglist.seed)
+        fast = bench(level, True, arglist.steps, arglist.passed_time, arglist.seed)
+        print(f"{level:<8}{full:>12.0f}{fast:>12.0f}{fast / full:>9.1f}x")
+    print("(steps/sec)")
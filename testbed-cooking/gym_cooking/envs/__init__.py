@@ -1 +1,2 @@
 from .overcooked_environment import OvercookedEnvironment
+from .vector_environment import VectorOvercookedEnv
@@ -15,10 +15,9 @@ from gym_cooking.utils.order_schedule import OrderScheduler
 from gym_cooking.utils.event import get_all_events
 
 import copy
-import networkx as nx
 import numpy as np
-from itertools import combinations, product
-from collections import namedtuple
+from itertools import combinations
+from collections import namedtuple, defaultdict
 
 import gym
 import os
@@ -27,6 +26,11 @@ from dataclasses import dataclass
 
 CollisionRepr = namedtuple("CollisionRepr", "time agent_names agent_locations")
 
+ALL_ENTITIES = FRESH_FOOD + CHOPPING_FOOD + CHOPPED_FOOD + COOKING_FOOD + COOKED_FOOD + CHARRED_FOOD + ['Plate',
+                                                                                                        'Fire',
+                                                                                                        'FireExtinguisher']
+ALL_FOOD_ENTITIES = FRESH_FOOD + CHOPPED_FOOD + COOKED_FOOD + CHARRED_FOOD + ['Plate']
+
 @dataclass
 class MapSetting:
     level: str
@@ -40,7 +44,7 @@ class MapSetting:
 class OvercookedEnvironment(gym.Env):
     """Environment object for Overcooked."""
 
-    def __init__(self, arglist):
+    def __init__(self, arglist, headless=False):
         super().__init__()
 
         self.arglist = arglist
@@ -49,6 +53,11 @@ class OvercookedEnvironment(gym.Env):
             self.debug = arglist.debug
         if self.debug:
             arglist.record = True
+        # Headless mode: step() returns get_compact_state() instead of the full
+        # observation, and skips event copies and prints.
+        self.headless = headless
+        # Observation planes, see _update_observation.
+        self._obs_world = None
         self.t = 0
         self.set_filename()
 
@@ -131,13 +140,11 @@ class OvercookedEnvironment(gym.Env):
                         # GridSquare, i.e. Floor, Counter, Cutboard, Delivery, Bin
                         elif rep in RepToClass:
                             newobj = RepToClass[rep]((x, y))
-                            self.world.objects.setdefault(
-                                newobj.name, []).append(newobj)
+                            self.world.insert(obj=newobj)
                         else:
                             # Empty. Set a Floor tile.
                             f = Floor(location=(x, y))
-                            self.world.objects.setdefault(
-                                'Floor', []).append(f)
+                            self.world.insert(obj=f)
                     y += 1
                 # Phase 2: Read in recipe list.
                 elif phase == 2:
@@ -196,18 +203,19 @@ class OvercookedEnvironment(gym.Env):
         self.order_scheduler = OrderScheduler(self.arglist, self.recipes)
         self.world_size = (self.world.width, self.world.height)
         self.world.make_loc_to_gridsquare()
-        self.world.make_reachability_graph()
+        self.world.make_distance_matrix()
         self.cache_distances()
         # self.obs_tm1 = copy.copy(self)
 
-        self.state = state = self.get_current_state()
+        self.state = state = self.get_compact_state() if self.headless else self.get_current_state()
         return state
         # return copy.copy(self)
 
     def close(self):
         return
 
-    def step(self, action_dict, passed_time=1.):
+    def step(self, action_dict, passed_time=1., observe=None):
+        """observe: whether to build the full observation, defaults to not self.headless."""
         # Track internal environment info.
         self.t += 1
         self.current_time += passed_time
@@ -230,7 +238,7 @@ class OvercookedEnvironment(gym.Env):
             self._event_history.append(event)
             if len(self._event_history) > self._EVENT_HISTORY_MAX_LEN:
                 self._event_history.pop(0)
-            if event.event not in self.all_events:
+            if event.event not in self.all_events and not self.headless:
                 print("Invalid event detected: {}".format(event.event))
 
         # Update Orders
@@ -258,7 +266,9 @@ class OvercookedEnvironment(gym.Env):
                 else:
                     print("    ", o.name, o.location)
 
-        self.state = state = self.get_current_state()
+        if observe is None:
+            observe = not self.headless
+        self.state = state = self.get_current_state() if observe else self.get_compact_state()
         done = self.done()
         reward = self.reward()
         '''info = {"t": self.t, "obs": new_obs,
@@ -301,9 +311,7 @@ class OvercookedEnvironment(gym.Env):
         return [agent.name for agent in self.sim_agents]
 
     def clear_delivery(self):
-        delivery_list = list(
-            filter(lambda o: o.name == 'Delivery', self.world.get_object_list()))
-        for delivery in delivery_list:
+        for delivery in self.world.get_all_delivery_gridsquares():
             o = delivery.release()
             while o:
                 self.world.remove(o)
@@ -341,7 +349,7 @@ class OvercookedEnvironment(gym.Env):
                 if 'Charred' not in pre_update_name and 'Charred' in after_update_name:
                     fire = Fire()
                     self.world.remove(pot.holding)
-                    pot.holding.contents.append(fire)
+                    pot.holding.merge(fire)
                     self.world.insert(pot.holding)
 
         # remove fire
@@ -352,7 +360,7 @@ class OvercookedEnvironment(gym.Env):
                     x for x in pot.holding.contents if isinstance(x, Fire)][0]
                 if fire.is_finished:
                     self.world.remove(pot.holding)
-                    pot.holding.contents.remove(fire)
+                    pot.holding.unmerge(fire.full_name)
                     self.world.insert(pot.holding)
 
     def is_collision(self, agent1_loc, agent2_loc, agent1_action, agent2_action):
@@ -426,6 +434,47 @@ class OvercookedEnvironment(gym.Env):
         self.chg_rand_list = l
         self.process_chg()
 
+    def get_checkpoint(self):
+        """Everything that step() changes, for load_checkpoint.
+
+        The result refers to the live objects of the environment and should
+        be pickled (e.g. by Replay.checkpoint) before stepping again. Histories
+        that only grow (interactions, collisions) are not included."""
+        order_scheduler = self.order_scheduler
+        return {
+            'world_objects': dict(self.world.objects),
+            'sim_agents': self.sim_agents,
+            'order_scheduler': {k: getattr(order_scheduler, k) for k in (
+                'current_orders', 'rand_recipe_list', 'rand_recipe_idx', 'reward',
+                'successful_orders', 'failed_orders')},
+            't': self.t,
+            'current_time': self.current_time,
+            'chg_rand_list': self.chg_rand_list,
+            'chg_rand_index': getattr(self, 'chg_rand_index', 0),
+            'event_history': self._event_history,
+            'agent_actions': self.agent_actions,
+        }
+
+    def load_checkpoint(self, checkpoint):
+        """Restores an unpickled get_checkpoint() on an environment reset on the same map.
+
+        The world, agent list and order scheduler are updated in place, so
+        references held by a Game stay valid, and the checkpoint is owned by
+        the environment afterwards."""
+        self.world.objects = defaultdict(lambda: [], checkpoint['world_objects'])
+        self.world.make_location_index()
+        self.sim_agents[:] = checkpoint['sim_agents']
+        for k, v in checkpoint['order_scheduler'].items():
+            setattr(self.order_scheduler, k, v)
+        self.t = checkpoint['t']
+        self.current_time = checkpoint['current_time']
+        self.chg_rand_list = checkpoint['chg_rand_list']
+        self.chg_rand_index = checkpoint['chg_rand_index']
+        self._event_history = checkpoint['event_history']
+        self.agent_actions = checkpoint['agent_actions']
+        self._obs_world = None
+        self.state = self.get_compact_state() if self.headless else self.get_current_state()
+
     def check_collisions(self):
         """Checks for collisions and corrects agents' executable actions.
 
@@ -474,7 +523,7 @@ class OvercookedEnvironment(gym.Env):
             self.agent_actions[agent.name] = agent.action
             if self.chg_grid is not None and self.chg_grid in result.event:
                 self.process_chg()
-        self.last_step_events = copy.deepcopy(events)
+        self.last_step_events = events if self.headless else copy.deepcopy(events)
         return events
 
     def cache_distances(self):
@@ -489,80 +538,96 @@ class OvercookedEnvironment(gym.Env):
         dest_objs = source_objs
 
         # From every source (Counter and Floor objects),
-        # calculate distance to other nodes.
+        # read the distance to other nodes off the world's distance matrix.
+        index = [self.world.cell_index[o.location] for o in dest_objs]
         for source in source_objs:
-            self.distances[source.location] = {}
+            row = self.world.distance_matrix[self.world.cell_index[source.location], index].tolist()
             # Source to source distance is 0.
-            self.distances[source.location][source.location] = 0
-            for destination in dest_objs:
-                # Possible edges to approach source and destination.
-                source_edges = [
-                    (0, 0)] if not source.collidable else World.NAV_ACTIONS
-                destination_edges = [
-                    (0, 0)] if not destination.collidable else World.NAV_ACTIONS
-                # Maintain shortest distance.
-                shortest_dist = np.inf
-                for source_edge, dest_edge in product(source_edges, destination_edges):
-                    try:
-                        dist = nx.shortest_path_length(self.world.reachability_graph, (source.location, source_edge),
-                                                       (destination.location, dest_edge))
-                        # Update shortest distance.
-                        if dist < shortest_dist:
-                            shortest_dist = dist
-                    except:
-                        continue
+            self.distances[source.location] = {source.location: 0}
+            for destination, dist in zip(dest_objs, row):
                 # Cache distance floor -> counter.
-                self.distances[source.location][destination.location] = shortest_dist
+                self.distances[source.location][destination.location] = np.inf if dist == np.inf else int(dist)
 
         # Save all distances under world as well.
         self.world.distances = self.distances
 
-    def get_current_state(self):
-        # gridsquare
-        gridsquare_map = {
-            gs: np.zeros(self.world_size, dtype=np.uint8) for gs in GRIDSQUARES
-        }
-        objs = []
-
-        # gridsquares
-        for o_list in self.world.objects.values():
-            for o in o_list:
-                if isinstance(o, GridSquare):
-                    gridsquare_map[o.name][o.location[0], o.location[1]] = 1
-                else:
-                    objs.append(o)
-
-        # objects
-        ALL_ENTITIES = FRESH_FOOD + CHOPPING_FOOD + CHOPPED_FOOD + COOKING_FOOD + COOKED_FOOD + CHARRED_FOOD + ['Plate',
-                                                                                                                'Fire',
-                                                                                                                'FireExtinguisher']
-        ALL_FOOD_ENTITIES = FRESH_FOOD + CHOPPED_FOOD + \
-            COOKED_FOOD + CHARRED_FOOD + ['Plate']
-        obj_map = {
-            e: np.zeros(self.world_size, dtype=np.uint8) for e in ALL_ENTITIES
-        }
-        for o in objs:
+    def _make_observation(self):
+        """Allocates the observation planes and fills them from the whole world."""
+        gridsquares = list(dict.fromkeys(GRIDSQUARES))
+        entities = list(dict.fromkeys(ALL_ENTITIES))
+        agents = list(dict.fromkeys(agent.name for agent in self.sim_agents))
+        self._obs_world = self.world
+        self._obs_num_static = len(gridsquares) + len(entities)
+        self._obs_gridsquare = {gs: i for i, gs in enumerate(gridsquares)}
+        self._obs_entity = {e: len(gridsquares) + i for i, e in enumerate(entities)}
+        self._obs_cooking = self._obs_num_static
+        self._obs_chopping = self._obs_num_static + 1
+        self._obs_agent = {name: self._obs_num_static + 2 + i for i, name in enumerate(agents)}
+        self._obs_map = np.zeros((self._obs_num_static + 2 + len(agents),) + self.world_size, dtype=np.float32)
+        self._obs_timers = []              # cells set in the cooking/chopping planes
+        self._obs_agent_locations = {}
+
+        self.world.changed_locations.clear()
+        for location in set(self.world.gridsquare_at) | set(self.world.objects_at):
+            self._update_observation_at(location)
+
+    def _update_observation_at(self, location):
+        x, y = location
+        obs_map = self._obs_map
+        obs_map[:self._obs_num_static, x, y] = 0
+        gs = self.world.gridsquare_at.get(location)
+        if gs is not None:
+            obs_map[self._obs_gridsquare[gs.name], x, y] = 1
+        for o in self.world.objects_at.get(location, ()):
             for c in o.contents:
-                obj_map[c.full_name][o.location[0], o.location[1]] = 1
-        obj_map['cooking_rest_time'] = np.zeros(
-            self.world_size, dtype=np.float32)
+                obs_map[self._obs_entity[c.full_name], x, y] = 1
+
+    def _update_observation(self):
+        """Brings the observation planes up to date with the world.
+
+        Only the cells the world reports as changed since the last call are
+        rewritten, while the cooking and chopping timers and the agent planes
+        are recomputed."""
+        if self._obs_world is not self.world:
+            self._make_observation()
+        obs_map = self._obs_map
+
+        # chopping in place changes the food without going through the world
+        cutboards = self.world.get_all_gridsquares('Cutboard')
+        changed = self.world.changed_locations
+        changed.update(cutboard.location for cutboard in cutboards if cutboard.holding is not None)
+        for location in changed:
+            self._update_observation_at(location)
+        changed.clear()
+
+        for x, y in self._obs_timers:
+            obs_map[self._obs_cooking, x, y] = 0
+            obs_map[self._obs_chopping, x, y] = 0
+        self._obs_timers = []
         for pot in self.world.get_all_gridsquares('Pot'):
             if pot.holding is not None and pot.holding.is_cooking():
-                obj_map['cooking_rest_time'][
-                    pot.location[0], pot.location[1]] = pot.holding.rest_cooking_time() / COOKING_TIME_SECONDS
-        obj_map['chopping_num_steps'] = np.zeros(
-            self.world_size, dtype=np.float32)
-        for cutboard in self.world.get_all_gridsquares('Cutboard'):
+                x, y = pot.location
+                obs_map[self._obs_cooking, x, y] = pot.holding.rest_cooking_time() / COOKING_TIME_SECONDS
+                self._obs_timers.append((x, y))
+        for cutboard in cutboards:
             if cutboard.holding is not None and cutboard.holding.full_name.startswith('Chopping'):
-                obj_map['chopping_num_steps'][cutboard.location[0], cutboard.location[1]] = cutboard.holding.contents[
-                    0].state._rest_steps / CHOPPING_NUM_STEPS
+                x, y = cutboard.location
+                obs_map[self._obs_chopping, x, y] = cutboard.holding.contents[0].state._rest_steps / CHOPPING_NUM_STEPS
+                self._obs_timers.append((x, y))
 
-        # agents
-        agent_map = {
-            agent.name: np.zeros(self.world_size, dtype=np.uint8) for agent in self.sim_agents
-        }
         for agent in self.sim_agents:
-            agent_map[agent.name][agent.location[0], agent.location[1]] = 1
+            plane = self._obs_agent[agent.name]
+            location = self._obs_agent_locations.get(agent.name)
+            if location != agent.location:
+                if location is not None:
+                    obs_map[plane, location[0], location[1]] = 0
+                obs_map[plane, agent.location[0], agent.location[1]] = 1
+                self._obs_agent_locations[agent.name] = agent.location
+
+    def get_current_state(self, copy=True):
+        """copy: whether 'map' is a copy, or a view of the observation buffer that
+        is overwritten by the next call."""
+        self._update_observation()
 
         # agent location and holdings
         agent_data = {
@@ -591,22 +656,22 @@ class OvercookedEnvironment(gym.Env):
         current_orders_np = np.concatenate(
             [np.concatenate([order_onehot, np.array([t])]) for order_onehot, t in current_orders])
 
-        '''result = {
-            'gridsquare': gridsquare_map,
-            'objects': obj_map,
-            'agent_locations': agent_map,
-            'agents': agent_data,
-            'current_orders': current_orders
-        }'''
-        result = [v for k, v in gridsquare_map.items()] + [v for k, v in obj_map.items()] + [v for k, v in
-                                                                                             agent_map.items()]
         result = {
-            'map': np.asarray(result),
+            'map': self._obs_map.copy() if copy else self._obs_map,
             'current_orders': current_orders_np,
             'current_holdings': current_holdings,
         }
         return result
 
+    def get_compact_state(self):
+        """Agents, orders and time only, without building any map."""
+        return {
+            'agents': tuple((agent.location, agent.get_holding()) for agent in self.sim_agents),
+            'current_orders': tuple((order.full_name, rest_time / time_limit)
+                                    for order, rest_time, time_limit, bonus in self.order_scheduler.current_orders),
+            'time': self.current_time,
+        }
+
     def get_all_events(self):
         return copy.deepcopy(self.all_events)
 
@@ -620,3 +685,16 @@ class OvercookedEnvironment(gym.Env):
                 "event_history": self._event_history,
                 "current_time": self.current_time,
                 "chg_grid": self.chg_grid}
+
+    def get_ai_snapshot(self):
+        """Same as get_ai_info, with read-only snapshots that share nothing
+        mutable with the environment and can be handed to other threads."""
+        order_scheduler = self.order_scheduler.get_snapshot()
+        if not self.arglist.ai_recipy:
+            order_scheduler = order_scheduler._replace(current_orders=())
+        return {"world": self.world.get_snapshot(),
+                "sim_agents": tuple(agent.get_snapshot() for agent in self.sim_agents),
+                "order_scheduler": order_scheduler,
+                "event_history": tuple(self._event_history),
+                "current_time": self.current_time,
+                "chg_grid": self.chg_grid}
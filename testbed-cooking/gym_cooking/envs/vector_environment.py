@@ -0,0 +1,194 @@
+import multiprocessing as mp
+import random
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from gym_cooking.envs.overcooked_environment import OvercookedEnvironment, MapSetting
+
+
+def _map_shape(map_setting: MapSetting):
+    env = OvercookedEnvironment(map_setting, headless=True)
+    env.reset()
+    return env.get_current_state(copy=False)['map'].shape
+
+
+def _write_map(maps, slot, m):
+    maps[slot] = 0
+    maps[slot, :, :m.shape[1], :m.shape[2]] = m
+
+
+def _reset_env(env, maps, slot):
+    env.reset()
+    state = env.get_current_state(copy=False)
+    _write_map(maps, slot, state['map'])
+    return state['current_orders'], state['current_holdings']
+
+
+def _step_env(env, action_dict, passed_time, maps, slot):
+    _, reward, done, info = env.step(action_dict, passed_time=passed_time, observe=False)
+    state = env.get_current_state(copy=False)
+    if done:
+        # keep the last observation of the episode, the slot gets the new one
+        info['final_map'] = state['map'].copy()
+        info['order_result'] = dict(
+            success=env.order_scheduler.successful_orders,
+            fail=env.order_scheduler.failed_orders,
+            reward=env.order_scheduler.reward
+        )
+        env.reset()
+        state = env.get_current_state(copy=False)
+    _write_map(maps, slot, state['map'])
+    return reward, done, info, state['current_orders'], state['current_holdings']
+
+
+def _worker(conn, shm_name, shape, map_settings, slots, seed):
+    shm = SharedMemory(name=shm_name)
+    try:
+        maps = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        if seed is not None:
+            random.seed(seed + slots[0])
+            np.random.seed(seed + slots[0])
+        envs = [OvercookedEnvironment(map_setting, headless=True) for map_setting in map_settings]
+
+        while True:
+            cmd, data = conn.recv()
+            try:
+                if cmd == 'reset':
+                    result = [_reset_env(env, maps, slot) for env, slot in zip(envs, slots)]
+                elif cmd == 'step':
+                    action_dicts, passed_time = data
+                    result = [_step_env(env, action_dict, passed_time, maps, slot)
+                              for env, slot, action_dict in zip(envs, slots, action_dicts)]
+                elif cmd == 'close':
+                    conn.send(('ok', None))
+                    return
+                else:
+                    raise ValueError("Unknown command {}".format(cmd))
+                conn.send(('ok', result))
+            except Exception:
+                conn.send(('error', traceback.format_exc()))
+    finally:
+        del maps
+        shm.close()
+
+
+class VectorOvercookedEnv:
+    """Steps several OvercookedEnvironment in lockstep.
+
+    The map observations of all the environments are stacked into one
+    (num_envs, channels, width, height) float32 array. Maps smaller than the
+    largest one are zero-padded at the far end. Environments whose episode
+    ends are reset right away: their slot then holds the first observation of
+    the next episode, and the last one is kept in info['final_map'] along with
+    info['order_result'].
+
+    With num_workers > 0 the environments are split over that many worker
+    processes, which write their maps into a shared memory buffer.
+    """
+
+    def __init__(self, map_settings: list[MapSetting], num_workers: int = 0, seed: int = None, copy: bool = True):
+        self.map_settings = list(map_settings)
+        self.num_envs = len(self.map_settings)
+        self.num_workers = min(num_workers, self.num_envs)
+        self.copy = copy
+
+        shapes = {}
+        for map_setting in self.map_settings:
+            if map_setting.level not in shapes:
+                shapes[map_setting.level] = _map_shape(map_setting)
+        channels = {s[0] for s in shapes.values()}
+        assert len(channels) == 1, "Environments have different number of map channels: {}".format(shapes)
+        self.map_shape = (self.num_envs, channels.pop(),
+                          max(s[1] for s in shapes.values()), max(s[2] for s in shapes.values()))
+
+        self._shm = None
+        self._workers = []
+        if self.num_workers == 0:
+            if seed is not None:
+                random.seed(seed)
+                np.random.seed(seed)
+            self.envs = [OvercookedEnvironment(map_setting, headless=True) for map_setting in self.map_settings]
+            self.maps = np.zeros(self.map_shape, dtype=np.float32)
+        else:
+            self.envs = None
+            size = int(np.prod(self.map_shape)) * np.dtype(np.float32).itemsize
+            self._shm = SharedMemory(create=True, size=size)
+            self.maps = np.ndarray(self.map_shape, dtype=np.float32, buffer=self._shm.buf)
+            self.maps[:] = 0
+
+            ctx = mp.get_context()
+            for slots in np.array_split(np.arange(self.num_envs), self.num_workers):
+                slots = [int(s) for s in slots]
+                parent_conn, child_conn = ctx.Pipe()
+                process = ctx.Process(target=_worker, daemon=True, args=(
+                    child_conn, self._shm.name, self.map_shape,
+                    [self.map_settings[s] for s in slots], slots, seed))
+                process.start()
+                child_conn.close()
+                self._workers.append((process, parent_conn, slots))
+
+    def _call(self, cmd, data_per_worker):
+        for (_, conn, _), data in zip(self._workers, data_per_worker):
+            conn.send((cmd, data))
+        results = [None] * self.num_envs
+        for _, conn, slots in self._workers:
+            status, result = conn.recv()
+            if status == 'error':
+                raise RuntimeError("Worker failed:\n{}".format(result))
+            for slot, r in zip(slots, result):
+                results[slot] = r
+        return results
+
+    def _obs(self, results):
+        return {
+            'map': self.maps.copy() if self.copy else self.maps,
+            'current_orders': [r[-2] for r in results],
+            'current_holdings': [r[-1] for r in results],
+        }
+
+    def reset(self):
+        if self.envs is not None:
+            results = [_reset_env(env, self.maps, slot) for slot, env in enumerate(self.envs)]
+        else:
+            results = self._call('reset', [None] * len(self._workers))
+        return self._obs(results)
+
+    def step(self, action_dicts: list[dict], passed_time=1.):
+        """action_dicts: one {agent name: action} dict per environment."""
+        assert len(action_dicts) == self.num_envs
+        if self.envs is not None:
+            results = [_step_env(env, action_dict, passed_time, self.maps, slot)
+                       for slot, (env, action_dict) in enumerate(zip(self.envs, action_dicts))]
+        else:
+            results = self._call('step', [([action_dicts[s] for s in slots], passed_time)
+                                          for _, _, slots in self._workers])
+
+        rewards = np.array([r[0] for r in results], dtype=np.float32)
+        dones = np.array([r[1] for r in results], dtype=bool)
+        infos = [r[2] for r in results]
+        return self._obs(results), rewards, dones, infos
+
+    def close(self):
+        for process, conn, _ in self._workers:
+            try:
+                conn.send(('close', None))
+                conn.recv()
+            except (BrokenPipeError, EOFError):
+                pass
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+        if self._shm is not None:
+            del self.maps
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
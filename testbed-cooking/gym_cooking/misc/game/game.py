@@ -9,6 +9,7 @@ import numpy as np
 
 graphics_dir = 'misc/game/graphics'
 _image_library = {}
+_scaled_image_library = {}
 
 
 def get_image(path):
@@ -22,6 +23,15 @@ def get_image(path):
     return image
 
 
+def get_scaled_image(path, size):
+    # scaling is much slower than blitting, sprites are drawn at a few sizes only
+    image = _scaled_image_library.get((path, size))
+    if image is None:
+        image = pygame.transform.scale(get_image(path), size)
+        _scaled_image_library[(path, size)] = image
+    return image
+
+
 class Game:
     def __init__(self, env, play=False):
         pygame.init()
@@ -76,14 +86,35 @@ class Game:
         except:
             return
         self.__plot_elements.append(('Fill', {'color': Color.FLOOR}))
-        objs = {
-            'normal': [],
-            'chopping': [],
-            'cook': [],
-            'held': [],
-        }
 
-        # Draw gridsquares
+        self.draw_world(replay)
+
+        # Draw current orders
+        self.draw_current_orders()
+
+        # Draw soup hint
+        self.draw_soup_hint()
+
+        # Draw current time
+        self.draw_current_time()
+
+        # print("[Plot]", self.__plot_elements, flush=True)
+
+        if paused:
+            self.draw_paused()
+        if chat:
+            self.draw_multiline(chat)
+
+        if self.play:
+            pygame.display.flip()
+            pygame.display.update()
+
+    def draw_world(self, replay=False):
+        """Draw gridsquares, objects and agents, i.e. everything above the orders"""
+        self.draw_gridsquares(replay)
+        self.draw_objects()
+
+    def draw_gridsquares(self, replay=False):
         for o_list in self.world.objects.values():
             for o in o_list:
                 if isinstance(o, GridSquare):
@@ -93,6 +124,19 @@ class Game:
                         self.draw_gridsquare(o1)
                     else:
                         self.draw_gridsquare(o)
+
+    def draw_objects(self):
+        objs = {
+            'normal': [],
+            'chopping': [],
+            'cook': [],
+            'held': [],
+        }
+
+        for o_list in self.world.objects.values():
+            for o in o_list:
+                if isinstance(o, GridSquare):
+                    continue
                 elif isinstance(self.world.get_gridsquare_at(o.location), Pot):
                     objs['cook'].append(o)
                 elif len(o.contents) == 1 and o.contents[0].full_name.startswith('Chopping'):
@@ -122,26 +166,6 @@ class Game:
         for o in objs['chopping']:
             self.draw_chopping_object(o)
 
-        # Draw current orders
-        self.draw_current_orders()
-
-        # Draw soup hint
-        self.draw_soup_hint()
-
-        # Draw current time
-        self.draw_current_time()
-
-        # print("[Plot]", self.__plot_elements, flush=True)
-
-        if paused:
-            self.draw_paused()
-        if chat:
-            self.draw_multiline(chat)
-
-        if self.play:
-            pygame.display.flip()
-            pygame.display.update()
-
     def draw_gridsquare(self, gs):
         sl = self.scaled_location(gs.location)
         fill = pygame.Rect(sl[0], sl[1], self.scale, self.scale)
@@ -174,7 +198,7 @@ class Game:
 
     def draw(self, path, size, location):
         image_path = '{}/{}.png'.format(graphics_dir, path)
-        image = pygame.transform.scale(get_image(image_path), size)
+        image = get_scaled_image(image_path, size)
         self.screen.blit(image, location)
         self.__plot_elements.append(
             ('Image', {'path': path, 'size': size, 'location': location}))
@@ -295,7 +319,7 @@ class Game:
     def draw_current_orders(self):
         if self.world.arglist.user_recipy and self.order_scheduler is not None:
             for i, (order, restTime, timeLimit, bonus) in enumerate(self.order_scheduler.current_orders):
-                self.draw_current_order(i, copy.deepcopy(order), restTime)
+                self.draw_current_order(i, copy.copy(order), restTime)
 
         # draw success and failed ones
         self.put_text(self.small_font, "Score", (40, 80, 180),
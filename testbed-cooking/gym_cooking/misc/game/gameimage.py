@@ -3,16 +3,25 @@ import os
 import numpy as np
 from pathlib import Path
 import gym_cooking
+from gym_cooking.utils.core import GridSquare
 from gym_cooking.misc.game.game import Game
 
 
 class GameImage(Game):
-    def __init__(self, filename, world, sim_agents, record=False, order_scheduler=None):
-        Game.__init__(self, world, sim_agents, order_scheduler=order_scheduler)
+    def __init__(self, env, filename='', record=False):
+        Game.__init__(self, env)
         self.game_record_dir = os.path.join(Path(gym_cooking.__file__).absolute(
         ).parent, 'misc/game/record/{}/'.format(filename))
         self.record = record
 
+        # world drawn by the last on_render, redrawn only when its key changes, on top of
+        # the gridsquares which only change with the change grid square
+        self._world_key = None
+        self._world_image = None
+        self._gridsquares_key = None
+        self._gridsquares_image = None
+        self.redraws = 0
+
     def on_init(self):
         super().on_init()
 
@@ -25,6 +34,39 @@ class GameImage(Game):
             for f in os.listdir(self.game_record_dir):
                 os.remove(os.path.join(self.game_record_dir, f))
 
+    def get_world_key(self, replay=False):
+        # everything draw_world depends on, the rest time drives the cooking, chopping and fire bars
+        objects = tuple((o.location, o.full_name, o.is_held, o.rest_turn_time())
+                        for o_list in self.world.objects.values() for o in o_list
+                        if not isinstance(o, GridSquare))
+        agents = tuple((agent.location, agent.holding.full_name if agent.holding is not None else None)
+                       for agent in self.sim_agents)
+        return objects, agents, None if replay else self.env.chg_grid
+
+    def draw_world(self, replay=False):
+        key = self.get_world_key(replay)
+        if key == self._world_key:
+            # get_visualization lacks the elements of cached layers
+            self.screen.blit(self._world_image, (0, 0))
+            return
+        super().draw_world(replay)
+        self._world_key = key
+        self._world_image = self.screen.copy()
+        self.redraws += 1
+
+    def draw_gridsquares(self, replay=False):
+        key = None if replay else self.env.chg_grid
+        if self._gridsquares_image is not None and key == self._gridsquares_key:
+            self.screen.blit(self._gridsquares_image, (0, 0))
+            return
+        super().draw_gridsquares(replay)
+        self._gridsquares_key = key
+        self._gridsquares_image = self.screen.copy()
+
+    def get_frame(self):
+        """Return the last rendered frame as raw rgb24 bytes"""
+        return pygame.image.tostring(self.screen, 'RGB')
+
     def get_image_obs(self):
         self.on_render()
         img_int = pygame.PixelArray(self.screen)
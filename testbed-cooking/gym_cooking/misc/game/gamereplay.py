@@ -1,4 +1,6 @@
 import copy
+import itertools
+import pickle
 import time
 import pygame
 from gym_cooking.utils.replay import Replay
@@ -12,15 +14,41 @@ class GamePlayReply(Game):
 
         self.speedup = 2.0
 
+        # state of env at the start of the replay, for seeking before the first checkpoint
+        self._initial = pickle.dumps(env.get_checkpoint(), protocol=pickle.HIGHEST_PROTOCOL)
+        self._records = None
+        self._render_args = {'paused': False}
+
+    def seek(self, t):
+        # jump to t seconds after the start of the replay: restore the last checkpoint
+        # before t, then replay the records up to t without rendering or waiting
+        checkpoint = self.replay.seek(t)
+        self.env.load_checkpoint(pickle.loads(self._initial) if checkpoint is None else checkpoint['state'])
+        self.current_agent = self.sim_agents[0]
+
+        end = self.replay.start_time + t if self.replay.start_time is not None else None
+        records = iter(self.replay)
+        for record in records:
+            if record['time'] >= end:
+                self._records = itertools.chain([record], records)
+                break
+            if record['name'] == 'env.step':
+                self.env.step(**record['args'], observe=False)
+            elif record['name'] == 'on_render':
+                self._render_args = record['args']
+        else:
+            self._records = records
+
     def on_execute(self):
         if self.on_init() == False:
             exit()
 
         # simulate
         last_t = time.time()
-        self.on_render(paused=False, replay=True)
+        self.on_render(replay=True, **copy.deepcopy(self._render_args))
 
-        for record in self.replay:
+        records = self._records if self._records is not None else iter(self.replay)
+        for record in records:
             if record['name'] == 'env.step':
                 sleep_time = max(record['args']['passed_time'] / self.speedup - (time.time() - last_t), 0)
                 last_t = time.time()
@@ -31,7 +59,7 @@ class GamePlayReply(Game):
             elif record['name'] == 'on_render':
                 args = copy.deepcopy(record['args'])
                 self.on_render(replay=True, **args)
-            
+
             else:
                 print(record['time'], " :", record['name'])
 
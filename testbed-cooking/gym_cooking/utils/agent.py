@@ -3,6 +3,7 @@ from termcolor import colored as color
 from collections import namedtuple
 
 AgentRepr = namedtuple("AgentRepr", "name location holding")
+AgentSnapshot = namedtuple("AgentSnapshot", "name location holding")
 
 # Colors for agents.
 COLORS = ['blue', 'magenta', 'yellow', 'green']
@@ -33,6 +34,10 @@ class SimAgent:
     def get_repr(self):
         return AgentRepr(name=self.name, location=self.location, holding=self.get_holding())
 
+    def get_snapshot(self):
+        holding = None if self.holding is None else self.holding.get_snapshot()
+        return AgentSnapshot(name=self.name, location=self.location, holding=holding)
+
     def get_holding(self):
         if self.holding is None:
             return 'None'
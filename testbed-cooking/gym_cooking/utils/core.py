@@ -12,6 +12,7 @@ from collections import namedtuple
 # GRIDSQUARES
 # -----------------------------------------------------------
 GridSquareRepr = namedtuple("GridSquareRepr", "name location holding")
+GridSquareSnapshot = namedtuple("GridSquareSnapshot", "name location collidable")
 
 class Rep:
     FLOOR = ' '
@@ -52,6 +53,9 @@ class GridSquare:
             gs.holding = copy.copy(self.holding)
         return gs
 
+    def get_snapshot(self):
+        return GridSquareSnapshot(name=self.name, location=self.location, collidable=self.collidable)
+
     def acquire(self, obj):
         obj.location = self.location
         self.holding = obj
@@ -162,18 +166,76 @@ class Pot(GridSquare):
 # Objects are wrappers around foods items, plates, and any combination of them
 
 ObjectRepr = namedtuple("ObjectRepr", "name location is_held")
+
+
+class ContentSnapshot(namedtuple("ContentSnapshot", "name full_name state")):
+    """Read-only copy of a food, plate, fire or fire extinguisher inside an Object.
+
+    Compares equal to anything with the same full name, so that checks such as
+    `Plate() in obj.contents` work on snapshots too."""
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return getattr(other, 'full_name', None) == self.full_name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.full_name)
+
+
+class ObjectSnapshot(namedtuple("ObjectSnapshot", "location name full_name contents is_held cooked rest_time")):
+    """Read-only copy of an Object, see Object.get_snapshot."""
+    __slots__ = ()
+    collidable = False
+
+    def is_cooked(self):
+        return self.cooked
+
+    def rest_turn_time(self):
+        return self.rest_time
+
 ValidFoodNames = ('ChoppedLettuce', 'ChoppedOnion', 'ChoppedTomato',
                   'ChoppedLettuce-ChoppedOnion', 'ChoppedLettuce-ChoppedTomato', 'ChoppedOnion-ChoppedTomato',
                   'ChoppedLettuce-ChoppedOnion-ChoppedTomato')
 
 class Object:
     def __init__(self, location, contents):
+        self.world = None   # world that indexes this object by location
         self.location = location
         self.contents = contents if isinstance(contents, list) else [contents]
+        # cached name and full_name, contents should only change through merge and unmerge
+        self._name = None
+        self._full_name = None
         self.is_held = False
         self.collidable = False
         self.dynamic = False
 
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, location):
+        if self.world is not None:
+            self.world.move_object(self, location)
+        self._location = location
+
+    def __getstate__(self):
+        # copies and pickles are not indexed by any world
+        state = self.__dict__.copy()
+        state['world'] = None
+        return state
+
+    def __setstate__(self, state):
+        if 'location' in state:  # pickled before location became a property
+            state = state.copy()
+            state['_location'] = state.pop('location')
+        self.__dict__.update(state)
+        self.world = None
+        self._name = self._full_name = None
+
     def __str__(self):
         res = "-".join(list(map(lambda x : str(x), sorted(self.contents, key=lambda i: i.name))))
         return res
@@ -189,25 +251,38 @@ class Object:
 
     def __copy__(self):
         new = Object(self.location, self.contents[0])
-        new.__dict__ = self.__dict__.copy()
+        new.__dict__ = self.__getstate__()
         new.contents = [copy.copy(c) for c in self.contents]
         return new
 
     @property
     def name(self):
         # concatenate names of alphabetically sorted items, e.g.
-        sorted_contents = sorted(self.contents, key=lambda c: c.name)
-        return "-".join([c.name for c in sorted_contents])
+        if self._name is None:
+            self._name = "-".join(sorted(c.name for c in self.contents))
+        return self._name
 
     @property
     def full_name(self):
         # concatenate names of alphabetically sorted items, e.g.
-        sorted_contents = sorted(self.contents, key=lambda c: c.full_name)
-        return "-".join([c.full_name for c in sorted_contents])
+        if self._full_name is None:
+            self._full_name = "-".join(sorted(c.full_name for c in self.contents))
+        return self._full_name
+
+    def _contents_changed(self):
+        self._name = self._full_name = None
 
     def get_repr(self):
         return ObjectRepr(name=self.full_name, location=self.location, is_held=self.is_held)
 
+    def get_snapshot(self):
+        contents = tuple(ContentSnapshot(name=c.name, full_name=c.full_name,
+                                         state=c.get_state() if isinstance(c, Food) else None)
+                         for c in self.contents)
+        return ObjectSnapshot(location=self.location, name=self.name, full_name=self.full_name,
+                              contents=contents, is_held=self.is_held,
+                              cooked=self.is_cooked(), rest_time=self.rest_turn_time())
+
     def get_name(self):
         return self.full_name
 
@@ -228,6 +303,7 @@ class Object:
         assert len(self.contents) == 1
         assert self.needs_chopped()
         self.contents[0].update_state(current_time)
+        self._full_name = None
         # assert not (self.needs_chopped())
 
     def merge(self, obj):
@@ -238,16 +314,19 @@ class Object:
             raise ValueError("Incorrect merge object: {}".format(obj))
         else:
             self.contents.append(obj)
+        self._contents_changed()
 
     def unmerge(self, full_name):
         # remove by full_name, assumming all unique contents
         matching = list(filter(lambda c: c.full_name == full_name, self.contents))
         self.contents.remove(matching[0])
+        self._contents_changed()
         return matching[0]
 
     def update_state(self, current_time):
         for c in self.contents:
             c.update_state(current_time)
+        self._full_name = None
 
     def split_food_plate(self):
         food = []
@@ -317,6 +396,7 @@ class Object:
         for c in self.contents:
             assert isinstance(c, Food)
             c.cook(current_time)
+        self._full_name = None
 
 def mergeable(obj1, obj2):
     # query whether two objects are mergeable
@@ -333,7 +413,7 @@ def mergeable(obj1, obj2):
     if obj2.is_cooked() and len(obj1.contents) == 1 and Plate() in obj1.contents:
         return True
 
-    contents = obj1.contents + obj2.contents
+    contents = list(obj1.contents) + list(obj2.contents)
     # check that there is at most one plate
     try:
         contents.remove(Plate())
@@ -370,6 +450,8 @@ class FoodSequence:
     FRESH_CHOPPING_CHOPPED_COOKING_COOKED_CHARRED = FRESH_CHOPPING_CHOPPED_COOKING_COOKED + [FoodState.CHARRED]
 
 class Food:
+    __slots__ = ('state_index', 'state_seq', 'rep', 'name', 'movable', 'color', '_state', '_full_name')
+
     def __init__(self):
         self.state = self.state_seq[self.state_index](self.name)
         self.movable = False
@@ -387,9 +469,19 @@ class Food:
     def __len__(self):
         return 1   # one food unit
 
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        # every state transition goes through here
+        self._state = state
+        self._full_name = '{}{}'.format(state.name, self.name)
+
     @property
     def full_name(self):
-        return '{}{}'.format(self.get_state(), self.name)
+        return self._full_name
 
     def set_state(self, state):
         assert state in self.state_seq, "Desired state {} does not exist for the food with sequence {}".format(state, self.state_seq)
@@ -435,6 +527,8 @@ class Food:
         self.state = FoodState.COOKING(obj=self.name, start_time=current_time)
 
 class Tomato(Food):
+    __slots__ = ()
+
     def __init__(self, state_index = 0):
         self.state_index = state_index   # index in food's state sequence
         self.state_seq = FoodSequence.FRESH_CHOPPING_CHOPPED_COOKING_COOKED_CHARRED
@@ -449,6 +543,8 @@ class Tomato(Food):
         return Food.__str__(self)
 
 class Lettuce(Food):
+    __slots__ = ()
+
     def __init__(self, state_index = 0):
         self.state_index = state_index   # index in food's state sequence
         self.state_seq = FoodSequence.FRESH_CHOPPING_CHOPPED_COOKING_COOKED_CHARRED
@@ -461,6 +557,8 @@ class Lettuce(Food):
         return Food.__hash__(self)
 
 class Onion(Food):
+    __slots__ = ()
+
     def __init__(self, state_index = 0):
         self.state_index = state_index   # index in food's state sequence
         self.state_seq = FoodSequence.FRESH_CHOPPING_CHOPPED_COOKING_COOKED_CHARRED
@@ -476,11 +574,12 @@ class Onion(Food):
 # -----------------------------------------------------------
 
 class Plate:
-    def __init__(self):
-        self.rep = "p"
-        self.name = 'Plate'
-        self.full_name = 'Plate'
-        self.color = 'white'
+    __slots__ = ()
+    rep = "p"
+    name = 'Plate'
+    full_name = 'Plate'
+    color = 'white'
+
     def __hash__(self):
         return hash((self.name))
     def __str__(self):
@@ -495,11 +594,13 @@ class Plate:
 # -----------------------------------------------------------
 
 class Fire:
+    __slots__ = ('rest', 'last_putout_time', 'latest_time')
+    rep = "x"
+    name = 'Fire'
+    full_name = 'Fire'
+    color = 'red'
+
     def __init__(self):
-        self.rep = "x"
-        self.name = 'Fire'
-        self.full_name = 'Fire'
-        self.color = 'red'
         self.rest = FIRE_PUTOUT_TIME_SECONDS
         self.last_putout_time = {}
         self.latest_time = -1e9
@@ -3,6 +3,9 @@ from gym_cooking.utils.config import ORDER_EXPIRE_PUNISH
 
 import numpy as np
 import copy
+from collections import namedtuple
+
+OrderSchedulerSnapshot = namedtuple("OrderSchedulerSnapshot", "current_orders")
 
 
 class OrderScheduler:
@@ -31,6 +34,11 @@ class OrderScheduler:
         for _ in range(self.max_num_orders):
             self.current_orders.append(self.new_order())
 
+    def get_snapshot(self):
+        return OrderSchedulerSnapshot(current_orders=tuple(
+            (order.get_snapshot(), rest_time, time_limit, bonus)
+            for order, rest_time, time_limit, bonus in self.current_orders))
+
     def __copy__(self):
         new = OrderScheduler(self.arglist, copy.copy(self.recipes))
         new.rand_recipe_list = copy.copy(self.rand_recipe_list)
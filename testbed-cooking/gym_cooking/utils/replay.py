@@ -1,10 +1,244 @@
+import bisect
+import hashlib
 import pickle
+import queue
+import struct
 import time
 import threading
+import zlib
+from collections import namedtuple
 
+# streamed replay file:
+#   MAGIC
+#   frames: kind (1 byte), payload length (4 bytes), zlib compressed pickle
+#   index frame and end frame, written by close
+# older replays are a single pickle of Replay._d
+MAGIC = b'OCREPLAY'
+_HEADER = struct.Struct('<BI')
+_OFFSET = struct.Struct('<Q')
+FRAME_LOG = 0           # payload: {'time', 'name', 'args'}
+FRAME_SET = 1           # payload: (key, value)
+FRAME_CHECKPOINT = 2    # payload: {'step', 'time', 'state'}, state from OvercookedEnvironment.get_checkpoint
+FRAME_INDEX = 3         # payload: see ReplayWriter._index
+FRAME_END = 4           # raw payload: offset of the index frame, always the last frame
+FRAME_BLOB = 5          # payload: (digest, value), written before the first record using it
 
-class Replay:
+CHECKPOINT_STEPS = 100  # env.step records between checkpoints written by GamePlay
+INTERN_MIN_LEN = 64     # shorter strings are stored in place
+
+
+def is_stream_file(filename) -> bool:
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _iter_frames(f, kinds=None, start=None):
+    # yields (offset, kind, compressed payload) from start, or from the first frame
+    # frames of other kinds are skipped without being read
+    # a truncated last frame (crashed writer) ends the file
+    f.seek(len(MAGIC) if start is None else start)
+    while True:
+        offset = f.tell()
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        kind, length = _HEADER.unpack(header)
+        if kind == FRAME_END or (kinds is not None and kind not in kinds):
+            f.seek(length, 1)
+            continue
+        data = f.read(length)
+        if len(data) < length:
+            return
+        yield offset, kind, data
+
+
+def read_frames(filename, kinds=None, start=None):
+    # lazily yields (kind, payload) of the frames of a streamed replay, in file order
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a streamed replay: {}".format(filename))
+        for _, kind, data in _iter_frames(f, kinds, start):
+            yield kind, pickle.loads(zlib.decompress(data))
+
+
+def read_index(filename):
+    # index written by ReplayWriter.close, rebuilt from the frames if the file was not closed
+    with open(filename, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        end = _HEADER.size + _OFFSET.size
+        if size >= len(MAGIC) + end:
+            f.seek(size - end)
+            kind, length = _HEADER.unpack(f.read(_HEADER.size))
+            if kind == FRAME_END and length == _OFFSET.size:
+                offset, = _OFFSET.unpack(f.read(_OFFSET.size))
+                for _, _, data in _iter_frames(f, {FRAME_INDEX}, offset):
+                    return pickle.loads(zlib.decompress(data))
+
+        index = {'offsets': [], 'times': [], 'steps': [], 'checkpoints': []}
+        steps = 0
+        for offset, kind, data in _iter_frames(f, {FRAME_LOG, FRAME_CHECKPOINT}):
+            payload = pickle.loads(zlib.decompress(data))
+            if kind == FRAME_CHECKPOINT:
+                index['checkpoints'].append((payload['step'], payload['time'], offset))
+            else:
+                index['offsets'].append(offset)
+                index['times'].append(payload['time'])
+                index['steps'].append(steps)
+                steps += payload['name'] == 'env.step'
+        return index
+
+
+# record args['prep'] is stored as a PrepDelta against the prep of the previous record with the same name:
+#   changed: {key: value}, a long string is a BlobRef, a list is a ListDelta
+#   removed: keys that are gone
+# ListDelta.parts: (start, count, values), the list is previous[start:start + count] + values for every part
+PrepDelta = namedtuple("PrepDelta", "changed removed")
+ListDelta = namedtuple("ListDelta", "parts")
+BlobRef = namedtuple("BlobRef", "digest")
+
+
+def _digest(value) -> bytes:
+    return hashlib.blake2b(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), digest_size=16).digest()
+
+
+def _list_parts(old: list, new: list, values: list) -> list:
+    # runs of new copied from old, each followed by the values that are not in old
+    first = {}
+    for j, d in enumerate(old):
+        first.setdefault(d, j)
+    parts = []
+    for d, value in zip(new, values):
+        if parts and not parts[-1][2] and parts[-1][0] + parts[-1][1] < len(old) \
+                and old[parts[-1][0] + parts[-1][1]] == d:
+            parts[-1][1] += 1
+        elif d in first:
+            parts.append([first[d], 1, []])
+        else:
+            if not parts:
+                parts.append([0, 0, []])
+            parts[-1][2].append(value)
+    return [tuple(p) for p in parts]
+
+
+class PrepEncoder:
+    # writer side, keeps digests only, so later changes to logged values do not matter
+    def __init__(self, write_blob):
+        self._write_blob = write_blob
+        self._blobs = set()
+        self._last = {}     # record name -> {key: digest, or list of digests}
+
+    def reset(self):
+        # the next prep of every record name is stored whole, see Replay.checkpoint
+        self._last = {}
+
+    def encode(self, name: str, prep: dict) -> PrepDelta:
+        last = self._last.get(name, {})
+        digests, changed = {}, {}
+        for key, value in prep.items():
+            if isinstance(value, list):
+                digests[key] = [_digest(v) for v in value]
+                old = last.get(key)
+                if digests[key] != old:
+                    changed[key] = ListDelta(_list_parts(old if isinstance(old, list) else [], digests[key], value))
+            else:
+                digests[key] = _digest(value)
+                if digests[key] != last.get(key):
+                    changed[key] = self._intern(digests[key], value)
+        self._last[name] = digests
+        return PrepDelta(changed, [key for key in last if key not in prep])
+
+    def _intern(self, digest, value):
+        if not isinstance(value, str) or len(value) < INTERN_MIN_LEN:
+            return value
+        if digest not in self._blobs:
+            self._blobs.add(digest)
+            self._write_blob(digest, value)
+        return BlobRef(digest)
+
+
+class PrepDecoder:
+    # reader side, unchanged values are shared between the decoded records
     def __init__(self):
+        self.blobs = {}
+        self._last = {}     # record name -> prep
+
+    def reset(self):
+        self._last = {}
+
+    def decode(self, name: str, delta: PrepDelta) -> dict:
+        prep = dict(self._last.get(name, {}))
+        for key in delta.removed:
+            prep.pop(key, None)
+        for key, value in delta.changed.items():
+            if isinstance(value, BlobRef):
+                value = self.blobs[value.digest]
+            elif isinstance(value, ListDelta):
+                old = prep.get(key)
+                old = old if isinstance(old, list) else []
+                value = [v for start, count, values in value.parts for v in old[start:start + count] + values]
+            prep[key] = value
+        self._last[name] = prep
+        return prep
+
+
+class ReplayWriter:
+    """Appends frames to a streamed replay file.
+
+    Records are pickled by the caller, so later changes to them are not
+    recorded, then compressed and written by a background thread. The file is
+    flushed whenever the thread has nothing left to write."""
+
+    def __init__(self, filename, compress_level: int = 6):
+        self.compress_level = compress_level
+        self._file = open(filename, 'wb')
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        # offset, time and number of env.step records before every log frame,
+        # (step, time, offset) of every checkpoint frame
+        self._index = {'offsets': [], 'times': [], 'steps': [], 'checkpoints': []}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, kind: int, payload, time: float = None, step: int = None):
+        # time, step: position of log and checkpoint frames in the index
+        self._queue.put((kind, pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), time, step))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, data, time, step = item
+            if kind == FRAME_LOG:
+                self._index['offsets'].append(self._offset)
+                self._index['times'].append(time)
+                self._index['steps'].append(step)
+            elif kind == FRAME_CHECKPOINT:
+                self._index['checkpoints'].append((step, time, self._offset))
+            self._write_frame(kind, zlib.compress(data, self.compress_level))
+            if self._queue.empty():
+                self._file.flush()
+
+        offset = self._offset
+        self._write_frame(FRAME_INDEX, zlib.compress(pickle.dumps(self._index, protocol=pickle.HIGHEST_PROTOCOL)))
+        self._write_frame(FRAME_END, _OFFSET.pack(offset))
+        self._file.close()
+
+    def _write_frame(self, kind, data):
+        self._file.write(_HEADER.pack(kind, len(data)) + data)
+        self._offset += _HEADER.size + len(data)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+class Replay:
+    def __init__(self, filename=None):
+        # filename: stream the replay to this file while logging, see close
         self._d = {}
         self._d['dict'] = {}
         self._d['his'] = []
@@ -12,28 +246,136 @@ class Replay:
         #  - 1
         #  - 2
         self._lock = threading.Lock()
+        self._writer = ReplayWriter(filename) if filename is not None else None
+        self._encoder = PrepEncoder(self._write_blob) if filename is not None else None
+        self._steps = 0         # env.step records logged
+        self._filename = None   # streamed file read lazily by __iter__
+        self._index = None
+        self._start = None      # offset __iter__ starts from, see seek
 
     @classmethod
     def from_file(cls, filename):
         self = cls()
-        self._d = pickle.load(open(filename, 'rb'))
+        if is_stream_file(filename):
+            # only the dict is loaded, records are read when iterating
+            self._d['dict'] = dict(payload for _, payload in read_frames(filename, kinds={FRAME_SET}))
+            self._d['his'] = None
+            self._filename = filename
+        else:
+            self._d = pickle.load(open(filename, 'rb'))
         return self
 
     def save(self, filename):
+        assert self._writer is None, "Streamed replays are written while logging"
         pickle.dump(self._d, open(filename, 'wb'))
 
+    def close(self):
+        # wait until everything logged is on disk
+        if self._writer is not None:
+            self._writer.close()
+
     def __getitem__(self, item):
         return self._d['dict'][item]
 
+    def get(self, item, default=None):
+        return self._d['dict'].get(item, default)
+
     def __setitem__(self, key, value):
         with self._lock:
             self._d['dict'][key] = value
+            if self._writer is not None:
+                self._writer.write(FRAME_SET, (key, value))
+
+    def _write_blob(self, digest, value):
+        self._writer.write(FRAME_BLOB, (digest, value))
 
     def log(self, name: str, args: dict):
+        record = {'time': time.time(), 'name': name, 'args': args}
+        with self._lock:
+            if self._writer is not None:
+                if isinstance(args, dict) and isinstance(args.get('prep'), dict):
+                    record['args'] = dict(args, prep=self._encoder.encode(name, args['prep']))
+                self._writer.write(FRAME_LOG, record, time=record['time'], step=self._steps)
+            else:
+                self._d['his'].append(record)
+            self._steps += name == 'env.step'
+
+    def checkpoint(self, state):
+        # state: OvercookedEnvironment.get_checkpoint() after the last logged env.step
+        if self._writer is None:
+            return
         with self._lock:
-            self._d['his'].append(
-                {'time': time.time(), 'name': name, 'args': args})
+            t = time.time()
+            self._writer.write(FRAME_CHECKPOINT, {'step': self._steps, 'time': t, 'state': state},
+                               time=t, step=self._steps)
+            # records after a checkpoint do not depend on the ones before, except for blobs
+            self._encoder.reset()
+
+    @property
+    def index(self):
+        # streamed replays only, see read_index
+        if self._index is None:
+            self._index = read_index(self._filename)
+        return self._index
+
+    @property
+    def start_time(self):
+        # time of the first record
+        if self._filename is not None:
+            times = self.index['times']
+        else:
+            times = [record['time'] for record in self._d['his'][:1]]
+        return times[0] if times else None
+
+    def seek(self, t: float):
+        """Moves __iter__ to the last checkpoint at most t seconds after the
+        first record, and returns it (None if there is none, __iter__ then
+        starts from the first record). The records from there to t are left
+        for the caller to replay."""
+        if self._filename is None or not self.index['times']:
+            self._start = None
+            return None
+        end = self.start_time + t
+        i = bisect.bisect_right([c[1] for c in self.index['checkpoints']], end) - 1
+        return self._seek_checkpoint(i)
+
+    def seek_step(self, step: int):
+        # same as seek, to the last checkpoint at most step env.step records in
+        if self._filename is None:
+            self._start = None
+            return None
+        i = bisect.bisect_right([c[0] for c in self.index['checkpoints']], step) - 1
+        return self._seek_checkpoint(i)
+
+    def _seek_checkpoint(self, i):
+        self._start = None
+        if i < 0:
+            return None
+        offset = self.index['checkpoints'][i][2]
+        for _, payload in read_frames(self._filename, {FRAME_CHECKPOINT}, start=offset):
+            self._start = offset
+            return payload
 
     def __iter__(self):
+        if self._filename is not None:
+            return self._iter_stream()
         return iter(self._d['his'])
-    
\ No newline at end of file
+
+    def _iter_stream(self):
+        decoder = PrepDecoder()
+        if self._start is not None:
+            decoder.blobs = dict(payload for _, payload in read_frames(self._filename, kinds={FRAME_BLOB}))
+        with open(self._filename, 'rb') as f:
+            for _, kind, data in _iter_frames(f, {FRAME_LOG, FRAME_BLOB, FRAME_CHECKPOINT}, self._start):
+                if kind == FRAME_CHECKPOINT:
+                    decoder.reset()
+                    continue
+                payload = pickle.loads(zlib.decompress(data))
+                if kind == FRAME_BLOB:
+                    digest, value = payload
+                    decoder.blobs[digest] = value
+                    continue
+                args = payload['args']
+                if isinstance(args, dict) and isinstance(args.get('prep'), PrepDelta):
+                    args['prep'] = decoder.decode(payload['name'], args['prep'])
+                yield payload
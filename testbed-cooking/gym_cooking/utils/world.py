@@ -1,7 +1,6 @@
 import numpy as np
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, deque, namedtuple, OrderedDict
 from itertools import product, combinations
-import networkx as nx
 import copy
 from functools import lru_cache
 
@@ -9,6 +8,14 @@ import gym_cooking.recipe_planner.utils as recipe
 from gym_cooking.utils.core import Object, GridSquare, Counter
 
 
+class WorldSnapshot(namedtuple("WorldSnapshot", "width height objects")):
+    """Read-only copy of a World, see World.get_snapshot."""
+    __slots__ = ()
+
+    def get_object_list(self):
+        return list(self.objects)
+
+
 class World:
     """World class that hold all of the non-agent objects in the environment."""
     NAV_ACTIONS = [(0, 1), (0, -1), (-1, 0), (1, 0)]
@@ -17,10 +24,18 @@ class World:
         self.rep = [] # [row0, row1, ..., rown]
         self.arglist = arglist
         self.objects = defaultdict(lambda : [])
+        # Location index, kept up to date by insert/remove and by Object.location.
+        self.gridsquare_at = {}                 # location -> gridsquare
+        self.objects_at = defaultdict(list)     # location -> objects
+        self.changed_locations = set()          # locations touched since the last observation
 
     def get_repr(self):
         return self.get_dynamic_objects()
 
+    def get_snapshot(self):
+        return WorldSnapshot(width=self.width, height=self.height,
+                             objects=tuple(o.get_snapshot() for o in self.get_object_list()))
+
     def __str__(self):
         _display = list(map(lambda x: ''.join(map(lambda y: y + ' ', x)), self.rep))
         return '\n'.join(_display)
@@ -29,10 +44,51 @@ class World:
         new = World(self.arglist)
         new.__dict__ = self.__dict__.copy()
         new.objects = copy.deepcopy(self.objects)
-        new.reachability_graph = self.reachability_graph
+        new.make_location_index()
         new.distances = self.distances
         return new
 
+    def make_location_index(self):
+        """Rebuilds the location index from self.objects."""
+        self.gridsquare_at = {}
+        self.objects_at = defaultdict(list)
+        self.changed_locations = set()
+        for obj in self.get_object_list():
+            self._index(obj)
+
+    def _index(self, obj):
+        self.changed_locations.add(obj.location)
+        if isinstance(obj, GridSquare):
+            self.gridsquare_at[obj.location] = obj
+        else:
+            obj.world = self
+            self.objects_at[obj.location].append(obj)
+
+    def _unindex(self, obj):
+        self.changed_locations.add(obj.location)
+        if isinstance(obj, GridSquare):
+            if self.gridsquare_at.get(obj.location) is obj:
+                del self.gridsquare_at[obj.location]
+        else:
+            obj.world = None
+            self._unindex_at(obj, obj.location)
+
+    def _unindex_at(self, obj, location):
+        objs = self.objects_at[location]
+        for i, o in enumerate(objs):
+            if o is obj:
+                objs.pop(i)
+                break
+        if not objs:
+            del self.objects_at[location]
+
+    def move_object(self, obj, location):
+        """Called by Object when its location changes."""
+        self._unindex_at(obj, obj.location)
+        self.objects_at[location].append(obj)
+        self.changed_locations.add(obj.location)
+        self.changed_locations.add(location)
+
     def update_display(self):
         # Reset the current display (self.rep).
         self.rep = [[' ' for i in range(self.width)] for j in range(self.height)]
@@ -56,44 +112,95 @@ class World:
             if isinstance(obj, GridSquare):
                 self.loc_to_gridsquare[obj.location] = obj
 
-    def make_reachability_graph(self):
-        """Create a reachability graph between world objects."""
-        self.reachability_graph = nx.Graph()
-        for x in range(self.width):
-            for y in range(self.height):
-                location = (x, y)
-                gs = self.loc_to_gridsquare[(x, y)]
-
-                # If not collidable, add node with direction (0, 0).
-                if not gs.collidable:
-                    self.reachability_graph.add_node((location, (0, 0)))
-
-                # Add nodes for collidable gs + all edges.
-                for nav_action in World.NAV_ACTIONS:
-                    new_location = self.inbounds(location=tuple(np.asarray(location) + np.asarray(nav_action)))
-                    new_gs = self.loc_to_gridsquare[new_location]
-
-                    # If collidable, add edges for adjacent noncollidables.
-                    if gs.collidable and not new_gs.collidable:
-                        self.reachability_graph.add_node((location, nav_action))
-                        if (new_location, (0, 0)) in self.reachability_graph:
-                            self.reachability_graph.add_edge((location, nav_action),
-                                                             (new_location, (0, 0)))
-                    # If not collidable and new_gs collidable, add edge.
-                    elif not gs.collidable and new_gs.collidable:
-                        if (new_location, tuple(-np.asarray(nav_action))) in self.reachability_graph:
-                            self.reachability_graph.add_edge((location, (0, 0)),
-                                                             (new_location, tuple(-np.asarray(nav_action))))
-                    # If both not collidable, add direct edge.
-                    elif not gs.collidable and not new_gs.collidable:
-                        if (new_location, (0, 0)) in self.reachability_graph:
-                            self.reachability_graph.add_edge((location, (0, 0)), (new_location, (0, 0)))
-                    # If both collidable, add nothing.
-
-        # If you want to visualize this graph, uncomment below.
-        # plt.figure()
-        # nx.draw(self.reachability_graph)
-        # plt.show()
+    def make_distance_matrix(self):
+        """Shortest path lengths between grid cells, with one BFS per floor cell.
+
+        Agents walk over non-collidable cells and reach a collidable cell from
+        any floor cell next to it, in one more step. floor_distances holds the
+        path lengths between floor cells (indexed by floor_index) and
+        distance_matrix the ones between any two cells (indexed by
+        cell_index), np.inf where there is no path.
+        """
+        cells = [(x, y) for x in range(self.width) for y in range(self.height)]
+        self.cell_index = {location: i for i, location in enumerate(cells)}
+        floors = [location for location in cells if not self.loc_to_gridsquare[location].collidable]
+        self.floor_index = {location: i for i, location in enumerate(floors)}
+
+        neighbors = []
+        for x, y in floors:
+            locations = {self.inbounds((x + dx, y + dy)) for dx, dy in World.NAV_ACTIONS}
+            neighbors.append([self.floor_index[l] for l in locations if l in self.floor_index and l != (x, y)])
+
+        self.floor_distances = np.full((len(floors), len(floors)), np.inf)
+        for source in range(len(floors)):
+            dist = [-1] * len(floors)
+            dist[source] = 0
+            queue = deque([source])
+            while queue:
+                i = queue.popleft()
+                for j in neighbors[i]:
+                    if dist[j] < 0:
+                        dist[j] = dist[i] + 1
+                        queue.append(j)
+            row = np.asarray(dist, dtype=float)
+            row[row < 0] = np.inf
+            self.floor_distances[source] = row
+
+        # (floor, steps) pairs each cell can be reached from
+        ports = [[] for _ in cells]
+        for location, i in self.cell_index.items():
+            for node in [(location, (0, 0))] + [(location, na) for na in World.NAV_ACTIONS]:
+                port = self._get_port(node)
+                if port is not None:
+                    ports[i].append(port)
+
+        to_floor = np.full((len(cells), len(floors)), np.inf)
+        for i, cell_ports in enumerate(ports):
+            for floor, steps in cell_ports:
+                np.minimum(to_floor[i], self.floor_distances[floor] + steps, out=to_floor[i])
+        self.distance_matrix = np.full((len(cells), len(cells)), np.inf)
+        for j, cell_ports in enumerate(ports):
+            for floor, steps in cell_ports:
+                np.minimum(self.distance_matrix[:, j], to_floor[:, floor] + steps, out=self.distance_matrix[:, j])
+            if cell_ports:
+                self.distance_matrix[j, j] = 0
+
+    def _get_port(self, node):
+        """(floor index, steps) for a node (location, nav_action), None if the node
+        does not exist. Floor cells are nodes with nav_action (0, 0), collidable
+        cells have one node per adjacent floor cell, at one step from it."""
+        location, nav_action = node
+        if location not in self.cell_index:
+            return None
+        if nav_action == (0, 0):
+            if location in self.floor_index:
+                return self.floor_index[location], 0
+            return None
+        if location in self.floor_index:
+            return None
+        floor = self.inbounds((location[0] + nav_action[0], location[1] + nav_action[1]))
+        if floor in self.floor_index:
+            return self.floor_index[floor], 1
+        return None
+
+    def get_path_length(self, node_a, node_b):
+        """Shortest path length between two (location, nav_action) nodes, np.inf
+        if there is none."""
+        port_a = self._get_port(node_a)
+        port_b = self._get_port(node_b)
+        if port_a is None or port_b is None:
+            return np.inf
+        if node_a == node_b:
+            return 0
+        dist = self.floor_distances[port_a[0], port_b[0]]
+        if dist == np.inf:
+            return np.inf
+        return int(dist) + port_a[1] + port_b[1]
+
+    def get_distance(self, location_a, location_b):
+        """Shortest path length between two cells, np.inf if there is none."""
+        dist = self.distance_matrix[self.cell_index[location_a], self.cell_index[location_b]]
+        return np.inf if dist == np.inf else int(dist)
 
     def get_lower_bound_between(self, subtask, agent_locs, A_locs, B_locs):
         """Return distance lower bound between subtask-relevant locations."""
@@ -118,28 +225,21 @@ class World:
 
         for A_na, B_na in product(A_possible_na, B_possible_na):
             if len(agent_locs) == 1:
-                try:
-                    bound_1 = nx.shortest_path_length(
-                            self.reachability_graph, (agent_locs[0], (0, 0)), (A_loc, A_na))
-                    bound_2 = nx.shortest_path_length(
-                            self.reachability_graph, (A_loc, A_na), (B_loc, B_na))
-                except:
+                bound_1 = self.get_path_length((agent_locs[0], (0, 0)), (A_loc, A_na))
+                bound_2 = self.get_path_length((A_loc, A_na), (B_loc, B_na))
+                if bound_1 == np.inf or bound_2 == np.inf:
                     continue
                 bound = bound_1 + bound_2 - 1
 
             elif len(agent_locs) == 2:
                 # Try to calculate the distances between agents and Objects A and B.
                 # Distance between Agent 1 <> Object A.
-                try:
-                    bound_1_to_A = nx.shortest_path_length(
-                            self.reachability_graph, (agent_locs[0], (0, 0)), (A_loc, A_na))
-                except:
+                bound_1_to_A = self.get_path_length((agent_locs[0], (0, 0)), (A_loc, A_na))
+                if bound_1_to_A == np.inf:
                     bound_1_to_A = self.perimeter
                 # Distance between Agent 2 <> Object A.
-                try:
-                    bound_2_to_A = nx.shortest_path_length(
-                            self.reachability_graph, (agent_locs[1], (0, 0)), (A_loc, A_na))
-                except:
+                bound_2_to_A = self.get_path_length((agent_locs[1], (0, 0)), (A_loc, A_na))
+                if bound_2_to_A == np.inf:
                     bound_2_to_A = self.perimeter
 
                 # Take the agent that's the closest to Object A.
@@ -149,15 +249,13 @@ class World:
                 bound_between_agents = float(abs(A_loc[0] - B_loc[0]) + abs(A_loc[1] - B_loc[1]))
 
                 # Distance between Agent 1 <> Object B.
-                try:
-                    bound_1_to_B = nx.shortest_path_length(self.reachability_graph, (agent_locs[0], (0, 0)), (B_loc, B_na))
-                except:
+                bound_1_to_B = self.get_path_length((agent_locs[0], (0, 0)), (B_loc, B_na))
+                if bound_1_to_B == np.inf:
                     bound_1_to_B = self.perimeter
 
                 # Distance between Agent 2 <> Object B.
-                try:
-                    bound_2_to_B = nx.shortest_path_length(self.reachability_graph, (agent_locs[1], (0, 0)), (B_loc, B_na))
-                except:
+                bound_2_to_B = self.get_path_length((agent_locs[1], (0, 0)), (B_loc, B_na))
+                if bound_2_to_B == np.inf:
                     bound_2_to_B = self.perimeter
 
                 # Take the agent that's the closest to Object B.
@@ -193,11 +291,7 @@ class World:
         return min_bound_to_A, min_bound_to_B
 
     def is_occupied(self, location):
-        o = list(filter(lambda obj: obj.location == location and
-         isinstance(obj, Object) and not(obj.is_held), self.get_object_list()))
-        if o:
-            return True
-        return False
+        return any(not obj.is_held for obj in self.objects_at.get(location, ()))
 
     def clear_object(self, position):
         """Clears object @ position in self.rep and replaces it with an empty space"""
@@ -213,6 +307,7 @@ class World:
 
     def insert(self, obj):
         self.objects.setdefault(obj.name, []).append(obj)
+        self._index(obj)
 
     def remove(self, obj):
         num_objs = len(self.objects[obj.name])
@@ -221,7 +316,7 @@ class World:
             if self.objects[obj.name][i].location == obj.location:
                 index = i
         assert index is not None, "Could not find {}!".format(obj.name)
-        self.objects[obj.name].pop(index)
+        self._unindex(self.objects[obj.name].pop(index))
         assert len(self.objects[obj.name]) < num_objs, "Nothing from {} was removed from world.objects".format(obj.name)
 
     def get_object_list(self):
@@ -251,7 +346,9 @@ class World:
         return list(map(lambda o: o.location, self.get_dynamic_objects()))
 
     def is_collidable(self, location):
-        return location in list(map(lambda o: o.location, list(filter(lambda o: o.collidable, self.get_object_list()))))
+        gs = self.gridsquare_at.get(location)
+        return (gs is not None and gs.collidable) or \
+            any(o.collidable for o in self.objects_at.get(location, ()))
 
     def get_object_locs(self, obj, is_held):
         if obj.name not in self.objects.keys():
@@ -269,16 +366,13 @@ class World:
         return list(set(self.get_object_locs(obj=obj, is_held=True) + self.get_object_locs(obj=obj, is_held=False)))
 
     def get_object_at(self, location, desired_obj, find_held_objects):
-        # Map obj => location => filter by location => return that object.
-        all_objs = self.get_object_list()
+        # Map location => objects there => filter => return that object.
+        all_objs = self.objects_at.get(location, ())
 
         if desired_obj is None:
-            objs = list(filter(
-                lambda obj: obj.location == location and isinstance(obj, Object) and obj.is_held is find_held_objects,
-                all_objs))
+            objs = list(filter(lambda obj: obj.is_held is find_held_objects, all_objs))
         else:
-            objs = list(filter(lambda obj: obj.name == desired_obj.name and obj.location == location and
-                isinstance(obj, Object) and obj.is_held is find_held_objects,
+            objs = list(filter(lambda obj: obj.name == desired_obj.name and obj.is_held is find_held_objects,
                 all_objs))
 
         assert len(objs) == 1, "looking for {}, found {} at {}".format(desired_obj, ','.join(o.get_name() for o in objs), location)
@@ -286,11 +380,9 @@ class World:
         return objs[0]
 
     def get_gridsquare_at(self, location):
-        gss = list(filter(lambda o: o.location == location and\
-            isinstance(o, GridSquare), self.get_object_list()))
-
-        assert len(gss) == 1, "{} gridsquares at {}: {}".format(len(gss), location, gss)
-        return gss[0]
+        gs = self.gridsquare_at.get(location)
+        assert gs is not None, "0 gridsquares at {}".format(location)
+        return gs
 
     def inbounds(self, location):
         """Correct locaiton to be in bounds of world object."""